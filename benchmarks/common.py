@@ -0,0 +1,52 @@
+"""Общие функции бенчмарков: статистика задержек и описание окружения."""
+import os
+import platform
+import statistics
+import subprocess
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'logistics_backend.settings')
+    import django
+    django.setup()
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, round(pct / 100 * (len(values) - 1)))
+    return round(values[index], 4)
+
+
+def latency_summary(latencies):
+    """p50/p95/p99, среднее и максимум в миллисекундах."""
+    ms = [value * 1000 for value in latencies]
+    return {
+        'p50_ms': percentile(ms, 50),
+        'p95_ms': percentile(ms, 95),
+        'p99_ms': percentile(ms, 99),
+        'mean_ms': round(statistics.mean(ms), 4) if ms else None,
+        'max_ms': round(max(ms), 4) if ms else None,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    import django
+    return {
+        'commit': git_revision(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
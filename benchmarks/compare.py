@@ -0,0 +1,81 @@
+"""Сравнение двух отчётов ``benchmarks.load`` (например, до и после коммита).
+
+Регрессией считается рост p95 или падение пропускной способности больше
+порога, а также любой рост числа запросов к БД на вызов. Код возврата 1,
+если регрессии есть::
+
+    python -m benchmarks.compare before.json after.json --threshold 0.15
+"""
+import argparse
+import json
+import sys
+
+
+def _change(old, new):
+    if not old or new is None:
+        return None
+    return (new - old) / old
+
+
+def compare(base, current, threshold):
+    """Строки сравнения и список найденных регрессий."""
+    rows = []
+    regressions = []
+    for endpoint, result in current['endpoints'].items():
+        base_result = base['endpoints'].get(endpoint)
+        if base_result is None:
+            continue
+        old_queries = base_result.get('db_queries')
+        new_queries = result.get('db_queries')
+        if old_queries is not None and new_queries is not None and new_queries > old_queries:
+            regressions.append(f'{endpoint}: запросов к БД {old_queries} -> {new_queries}')
+        for level, stats in result['levels'].items():
+            base_stats = base_result['levels'].get(level)
+            if base_stats is None:
+                continue
+            p95 = _change(base_stats['p95_ms'], stats['p95_ms'])
+            rps = _change(base_stats['throughput_rps'], stats['throughput_rps'])
+            rows.append((endpoint, level, base_stats['p95_ms'], stats['p95_ms'], p95,
+                         base_stats['throughput_rps'], stats['throughput_rps'], rps))
+            if p95 is not None and p95 > threshold:
+                regressions.append(f'{endpoint} c={level}: p95 {p95:+.0%}')
+            if rps is not None and rps < -threshold:
+                regressions.append(f'{endpoint} c={level}: пропускная способность {rps:+.0%}')
+    return rows, regressions
+
+
+def _fmt(value, pattern):
+    return '—' if value is None else pattern.format(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('base')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=0.15, help='Допустимое ухудшение, доля')
+    args = parser.parse_args(argv)
+
+    with open(args.base, encoding='utf-8') as base_file:
+        base = json.load(base_file)
+    with open(args.current, encoding='utf-8') as current_file:
+        current = json.load(current_file)
+
+    print(f"{base['meta'].get('commit')} -> {current['meta'].get('commit')}")
+    print(f"{'endpoint':<18}{'c':>4}{'p95 ms':>22}{'Δ':>8}{'rps':>22}{'Δ':>8}")
+    rows, regressions = compare(base, current, args.threshold)
+    for endpoint, level, old_p95, new_p95, p95, old_rps, new_rps, rps in rows:
+        print(
+            f"{endpoint:<18}{level:>4}"
+            f"{_fmt(old_p95, '{:.1f}') + ' -> ' + _fmt(new_p95, '{:.1f}'):>22}{_fmt(p95, '{:+.0%}'):>8}"
+            f"{_fmt(old_rps, '{:.1f}') + ' -> ' + _fmt(new_rps, '{:.1f}'):>22}{_fmt(rps, '{:+.0%}'):>8}"
+        )
+    if regressions:
+        print('\nРегрессии:')
+        for line in regressions:
+            print(f'  {line}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""Сравнение ёмкости по одновременным медленным скачиваниям: WSGI против ASGI.
+
+Открывает N одновременных скачиваний одного файла, каждый клиент читает
+ответ медленно (пауза между блоками), и считает, сколько передач завершилось
+успешно, время до первого байта (p50/p99) и общее время.
+
+Пример запуска::
+
+    gunicorn logistics_backend.wsgi:application -w 4 -b :8000
+    uvicorn logistics_backend.asgi:application --workers 1 --port 8001
+
+    python -m benchmarks.concurrent_downloads --token <token> -c 1000 \\
+        --target wsgi=http://localhost:8000/api/files/1/download/ \\
+        --target asgi=http://localhost:8001/api/async/files/1/download/
+
+Под WSGI каждое медленное скачивание занимает воркер на всё время передачи,
+поэтому число одновременно обслуживаемых клиентов ограничено числом
+воркеров/потоков; под ASGI — только памятью и дескрипторами.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+from .common import percentile
+
+
+async def _slow_download(client, url, headers, read_delay, chunk_size):
+    started = time.perf_counter()
+    first_byte = None
+    received = 0
+    async with client.stream('GET', url, headers=headers) as response:
+        if response.status_code != 200:
+            raise RuntimeError(f'HTTP {response.status_code}')
+        async for chunk in response.aiter_bytes(chunk_size):
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+            received += len(chunk)
+            if read_delay:
+                await asyncio.sleep(read_delay)
+    return first_byte, received
+
+
+async def run_target(url, token, connections, read_delay, chunk_size, timeout):
+    headers = {'Authorization': f'Token {token}'} if token else {}
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=0)
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *[
+                _slow_download(client, url, headers, read_delay, chunk_size)
+                for _ in range(connections)
+            ],
+            return_exceptions=True,
+        )
+        elapsed = time.perf_counter() - started
+
+    ok = [r for r in results if not isinstance(r, BaseException)]
+    errors = [r for r in results if isinstance(r, BaseException)]
+    ttfb = [first_byte for first_byte, _ in ok if first_byte is not None]
+    return {
+        'url': url,
+        'connections': connections,
+        'completed': len(ok),
+        'failed': len(errors),
+        'error_samples': sorted({type(e).__name__ for e in errors})[:5],
+        'elapsed_s': round(elapsed, 3),
+        'bytes': sum(received for _, received in ok),
+        'ttfb_p50_s': percentile(ttfb, 50),
+        'ttfb_p99_s': percentile(ttfb, 99),
+        'ttfb_mean_s': round(statistics.mean(ttfb), 4) if ttfb else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--target', action='append', required=True, metavar='NAME=URL',
+        help='Имя и URL скачивания; можно указать несколько раз',
+    )
+    parser.add_argument('--token', help='Токен пользователя (Authorization: Token ...)')
+    parser.add_argument('-c', '--connections', type=int, default=200)
+    parser.add_argument(
+        '--read-delay', type=float, default=0.05,
+        help='Пауза клиента между блоками, с (имитация медленной сети)',
+    )
+    parser.add_argument('--chunk-size', type=int, default=64 * 1024)
+    parser.add_argument('--timeout', type=float, default=120.0)
+    args = parser.parse_args(argv)
+
+    report = {}
+    for target in args.target:
+        name, _, url = target.partition('=')
+        report[name] = asyncio.run(run_target(
+            url, args.token, args.connections, args.read_delay,
+            args.chunk_size, args.timeout,
+        ))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""Генератор синтетических данных для бенчмарков.
+
+Создаёт N пользователей (и одного администратора) с M файлами у каждого
+через обычный путь загрузки (``uploads.save_uploaded_file``): файлы
+попадают на диск, в хранилище blob'ов и в счётчики. Размеры распределены
+логнормально (медиана около ``--median-size``, хвост до ``--max-size``),
+имена и содержимое похожи на реальные: накладные в PDF, CSV-выгрузки,
+XML-манифесты, сканы. При одинаковом ``--seed`` набор данных одинаков.
+
+Результат — JSON-манифест с токенами, id файлов и публичными ссылками,
+его читает ``benchmarks.load``::
+
+    python -m benchmarks.dataset --users 50 --files 200 --seed 1 \\
+        --manifest bench-dataset.json
+"""
+import argparse
+import json
+import math
+import random
+
+from .common import setup_django
+
+PREFIX = 'bench_'
+PASSWORD = 'bench-password'
+
+# (доля, шаблон имени, текстовое ли содержимое)
+FILE_KINDS = (
+    (0.35, 'WB-{n:06d}.pdf', False),
+    (0.25, 'export_{n}.csv', True),
+    (0.15, 'manifest_{n}.xml', True),
+    (0.15, 'scan_{n}.jpg', False),
+    (0.10, 'log_{n}.txt', True),
+)
+
+
+def _pick_kind(rng):
+    point = rng.random()
+    for share, template, text in FILE_KINDS:
+        point -= share
+        if point <= 0:
+            return template, text
+    return FILE_KINDS[-1][1:]
+
+
+def _size(rng, median, max_size):
+    return max(1, min(max_size, int(rng.lognormvariate(math.log(median), 1.2))))
+
+
+def _content(rng, size, text):
+    if not text:
+        return rng.randbytes(size)
+    lines = []
+    total = 0
+    while total < size:
+        line = f'{rng.randrange(10 ** 6)};WB-{rng.randrange(10 ** 6):06d};{rng.random():.4f};груз\n'
+        lines.append(line)
+        total += len(line.encode())
+    return ''.join(lines).encode()[:size]
+
+
+def _delete_existing(prefix):
+    from storage import jobs
+    from storage.models import User
+
+    for user in User.objects.filter(username__startswith=prefix):
+        jobs.execute(jobs.enqueue('delete_user', {'user_id': user.id}))
+
+
+def _create_user(username, is_admin=False):
+    from rest_framework.authtoken.models import Token
+
+    from storage.models import User
+
+    user = User.objects.create_user(
+        username=username,
+        email=f'{username}@example.com',
+        password=PASSWORD,
+        full_name=username,
+        is_admin=is_admin,
+        storage_path=f'users/{username}/',
+    )
+    token, _ = Token.objects.get_or_create(user=user)
+    return user, token.key
+
+
+def generate(users, files, seed, median_size, max_size, prefix=PREFIX, log=print):
+    from django.core.files.uploadedfile import SimpleUploadedFile
+
+    from storage import uploads
+
+    rng = random.Random(seed)
+    _delete_existing(prefix)
+    _, admin_token = _create_user(f'{prefix}admin', is_admin=True)
+    manifest = {
+        'seed': seed,
+        'users_count': users,
+        'files_per_user': files,
+        'median_size': median_size,
+        'max_size': max_size,
+        'password': PASSWORD,
+        'admin': {'username': f'{prefix}admin', 'token': admin_token},
+        'users': [],
+    }
+    total_bytes = 0
+    for i in range(users):
+        user, token = _create_user(f'{prefix}{i}')
+        entry = {'username': user.username, 'token': token, 'files': []}
+        for _ in range(files):
+            template, text = _pick_kind(rng)
+            name = template.format(n=rng.randrange(10 ** 6))
+            data = _content(rng, _size(rng, median_size, max_size), text)
+            user_file = uploads.save_uploaded_file(
+                user, SimpleUploadedFile(name, data), comment=f'накладная {name}'
+            )
+            total_bytes += len(data)
+            entry['files'].append({
+                'id': user_file.id,
+                'special_link': str(user_file.special_link),
+                'size': user_file.size,
+            })
+        manifest['users'].append(entry)
+        log(f'{user.username}: {files} файлов')
+    manifest['total_bytes'] = total_bytes
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--files', type=int, default=100, help='Файлов на пользователя')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--median-size', type=int, default=200 * 1024)
+    parser.add_argument('--max-size', type=int, default=20 * 1024 * 1024)
+    parser.add_argument('--prefix', default=PREFIX, help='Префикс имён пользователей бенчмарка')
+    parser.add_argument('--manifest', default='bench-dataset.json')
+    args = parser.parse_args(argv)
+
+    setup_django()
+    manifest = generate(
+        args.users, args.files, args.seed, args.median_size, args.max_size, args.prefix,
+    )
+    with open(args.manifest, 'w', encoding='utf-8') as output:
+        json.dump(manifest, output, ensure_ascii=False, indent=2)
+    print(f'Манифест записан в {args.manifest}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""Нагрузочный прогон по основным эндпоинтам хранилища.
+
+Для каждого эндпоинта и каждого уровня параллелизма отправляет
+``--requests`` запросов к запущенному серверу и считает пропускную
+способность и задержки p50/p95/p99 (время до полного получения ответа).
+Число запросов к БД на один вызов эндпоинта измеряется отдельно, в
+процессе, через тестовый клиент Django с теми же настройками — поэтому
+скрипт нужно запускать с тем же ``DJANGO_SETTINGS_MODULE`` и БД, что и
+сервер. Данные готовит ``benchmarks.dataset``.
+
+Запросы выбираются генератором со своим ``--seed``, а в отчёт попадают
+коммит и параметры прогона, поэтому отчёты разных коммитов сравнимы
+(см. ``benchmarks.compare``)::
+
+    gunicorn logistics_backend.wsgi:application -w 4 -b :8000
+    python -m benchmarks.load --base-url http://localhost:8000 \\
+        --manifest bench-dataset.json -c 1 8 32 --output before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import time
+
+import httpx
+
+from .common import environment, latency_summary, setup_django
+
+ENDPOINTS = ('login', 'file_list', 'upload', 'download', 'special_download', 'user_list')
+QUERY_SAMPLES = 5
+
+
+class Workload:
+    """Строит запросы к эндпоинтам по манифесту набора данных."""
+
+    def __init__(self, manifest, seed, upload_size):
+        self.manifest = manifest
+        self.rng = random.Random(seed)
+        self.upload_payload = random.Random(seed).randbytes(upload_size)
+
+    def _user(self):
+        return self.rng.choice(self.manifest['users'])
+
+    def request(self, endpoint):
+        """``(метод, путь, токен, параметры)`` очередного запроса."""
+        user = self._user()
+        token = user['token']
+        if endpoint == 'login':
+            data = {'username': user['username'], 'password': self.manifest['password']}
+            return 'POST', '/api/login/', None, {'json': data}
+        if endpoint == 'file_list':
+            return 'GET', '/api/files/', token, {'params': {'limit': 50}}
+        if endpoint == 'upload':
+            name = f'upload_{self.rng.randrange(10 ** 9)}.bin'
+            return 'POST', '/api/files/upload/', token, {'files': {'file': (name, self.upload_payload)}}
+        if endpoint == 'download':
+            user_file = self.rng.choice(user['files'])
+            return 'GET', f"/api/files/{user_file['id']}/download/", token, {}
+        if endpoint == 'special_download':
+            user_file = self.rng.choice(user['files'])
+            return 'GET', f"/api/files/special/{user_file['special_link']}/", token, {}
+        if endpoint == 'user_list':
+            return 'GET', '/api/users/', self.manifest['admin']['token'], {'params': {'limit': 50}}
+        raise ValueError(f'Неизвестный эндпоинт: {endpoint}')
+
+
+async def _send(client, workload, endpoint):
+    method, path, token, kwargs = workload.request(endpoint)
+    headers = {'Authorization': f'Token {token}'} if token else {}
+    started = time.perf_counter()
+    async with client.stream(method, path, headers=headers, **kwargs) as response:
+        received = 0
+        async for chunk in response.aiter_raw():
+            received += len(chunk)
+    return time.perf_counter() - started, response.status_code, received
+
+
+async def run_level(base_url, workload, endpoint, concurrency, total, timeout):
+    """Один эндпоинт при заданном числе одновременных клиентов."""
+    latencies = []
+    statuses = {}
+    received = 0
+    remaining = total
+
+    async def worker(client):
+        nonlocal remaining, received
+        while remaining > 0:
+            remaining -= 1
+            try:
+                latency, status_code, size = await _send(client, workload, endpoint)
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] = statuses.get(type(e).__name__, 0) + 1
+                continue
+            statuses[str(status_code)] = statuses.get(str(status_code), 0) + 1
+            if status_code < 400:
+                latencies.append(latency)
+                received += size
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*[worker(client) for _ in range(concurrency)])
+        elapsed = time.perf_counter() - started
+    return {
+        'requests': total,
+        'ok': len(latencies),
+        'statuses': statuses,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'bytes_received': received,
+        **latency_summary(latencies),
+    }
+
+
+def count_queries(workload, endpoint, samples=QUERY_SAMPLES):
+    """Медиана числа запросов к БД на вызов, по нескольким вызовам в процессе.
+
+    Первые вызовы прогревают кэши (токены, ссылки), поэтому берётся медиана.
+    """
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+
+    client = Client(HTTP_HOST='localhost')
+    counts = []
+    for _ in range(samples):
+        method, path, token, kwargs = workload.request(endpoint)
+        headers = {'HTTP_AUTHORIZATION': f'Token {token}'} if token else {}
+        with CaptureQueriesContext(connection) as queries:
+            if method == 'GET':
+                response = client.get(path, kwargs.get('params'), **headers)
+            elif 'json' in kwargs:
+                response = client.post(
+                    path, json.dumps(kwargs['json']), content_type='application/json', **headers
+                )
+            else:
+                from django.core.files.uploadedfile import SimpleUploadedFile
+                name, data = kwargs['files']['file']
+                response = client.post(path, {'file': SimpleUploadedFile(name, data)}, **headers)
+            if getattr(response, 'streaming', False):
+                for _ in response.streaming_content:
+                    pass
+            response.close()
+        counts.append(len(queries))
+    return int(statistics.median(counts))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--base-url', default='http://localhost:8000')
+    parser.add_argument('--manifest', default='bench-dataset.json')
+    parser.add_argument('-c', '--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=200, help='Запросов на эндпоинт и уровень')
+    parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--upload-size', type=int, default=256 * 1024)
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--no-queries', action='store_true', help='Не считать запросы к БД')
+    parser.add_argument('--output', help='Файл для JSON-отчёта (по умолчанию stdout)')
+    args = parser.parse_args(argv)
+
+    with open(args.manifest, encoding='utf-8') as manifest_file:
+        manifest = json.load(manifest_file)
+
+    report = {
+        'meta': {
+            'base_url': args.base_url,
+            'seed': args.seed,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'upload_size': args.upload_size,
+            'dataset': {
+                key: manifest[key]
+                for key in ('seed', 'users_count', 'files_per_user', 'median_size', 'total_bytes')
+            },
+            'settings': os.environ.get('DJANGO_SETTINGS_MODULE', 'logistics_backend.settings'),
+        },
+        'endpoints': {},
+    }
+    report['meta'].update(environment())
+    if not args.no_queries:
+        setup_django()
+
+    for endpoint in args.endpoints:
+        result = {'levels': {}}
+        if not args.no_queries:
+            result['db_queries'] = count_queries(
+                Workload(manifest, args.seed, args.upload_size), endpoint
+            )
+        for concurrency in args.concurrency:
+            # Свой генератор на каждый уровень: одинаковая последовательность запросов.
+            workload = Workload(manifest, args.seed, args.upload_size)
+            result['levels'][str(concurrency)] = asyncio.run(run_level(
+                args.base_url, workload, endpoint, concurrency, args.requests, args.timeout,
+            ))
+        report['endpoints'][endpoint] = result
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            output_file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
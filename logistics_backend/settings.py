@@ -37,6 +37,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework.authtoken',
     'rest_framework',
     'corsheaders',
@@ -44,6 +45,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'storage.middleware.MetricsMiddleware',
+    'storage.middleware.ReadYourWritesMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -99,9 +102,27 @@ DATABASES = {
         'PASSWORD': '123456',
         'HOST': 'localhost',
         'PORT': '5432',
+        # Постоянные подключения с проверкой перед повторным использованием.
+        'CONN_MAX_AGE': 300,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Реплики только для чтения: алиасы из DATABASES, например
+#     DATABASES['replica1'] = {**DATABASES['default'], 'HOST': 'replica1',
+#                              'TEST': {'MIRROR': 'default'}}
+#     DATABASE_REPLICAS = ['replica1']
+# Списки файлов и пользователей, профиль и поиск читаются с реплик; после
+# записи пользователь столько секунд читает из default. Нужен общий для
+# процессов CACHES (см. ниже), иначе реплики не используются. Реплика с
+# отставанием больше REPLICA_MAX_LAG_SECONDS не используется; проверяется
+# раз в REPLICA_CHECK_INTERVAL секунд.
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = ['storage.replicas.ReplicaRouter']
+REPLICA_READ_YOUR_WRITES_SECONDS = 5
+REPLICA_MAX_LAG_SECONDS = 5
+REPLICA_CHECK_INTERVAL = 10
+
 AUTH_USER_MODEL = 'storage.User'
 
 
@@ -150,13 +171,78 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'storage.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
 }
 
+# Кэш токенов: LRU в процессе (сек., записей) и общий кэш Django (сек.).
+# Общий уровень (и read-your-writes для реплик) работает только с кэшем,
+# общим для всех процессов, например
+#     CACHES = {'default': {
+#         'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+#         'LOCATION': 'redis://127.0.0.1:6379/1',
+#     }}
+# (нужен пакет redis). Без CACHES у каждого процесса свой кэш в памяти, и
+# токены кэшируются только в LRU процесса на AUTH_TOKEN_LOCAL_TTL секунд.
+AUTH_TOKEN_LOCAL_TTL = 10
+AUTH_TOKEN_LOCAL_SIZE = 10000
+AUTH_TOKEN_CACHE_TTL = 300
+
+# Кэш публичных ссылок special_link в памяти процесса (записей, сек.).
+SPECIAL_LINK_CACHE_SIZE = 10000
+SPECIAL_LINK_CACHE_TTL = 30
+
+# Уровни подкаталогов (по два символа stored_name) для файлов в каталогах
+# пользователей; после изменения — manage.py migrate_user_files_layout.
+STORAGE_FANOUT_LEVELS = 2
+
+# Сжатие хорошо сжимаемых файлов (CSV, XML, логи) на диске, gzip.
+STORAGE_COMPRESSION = False
+STORAGE_COMPRESSION_MIN_SIZE = 4096
+STORAGE_COMPRESSION_LEVEL = 6
+
+# Повторная проверка целостности blob'ов (manage.py scrub_blobs): каждый
+# blob перепроверяется не реже раза в столько дней.
+SCRUB_INTERVAL_DAYS = 30
+
+# Превью изображений (нужен Pillow): процессов для построения, лимит кэша
+# превью на диске в байтах, размеры, которые строятся сразу при загрузке
+# (пусто — только по запросу).
+PREVIEWS_ENABLED = True
+PREVIEW_WORKERS = 2
+PREVIEW_CACHE_MAX_BYTES = 1024 ** 3
+PREVIEW_UPLOAD_SIZES = []
+
+# Метрики Prometheus (/api/metrics/): токен, который Prometheus передаёт в
+# заголовке "Authorization: Bearer <токен>" (None — эндпоинт закрыт);
+# каталог для снимков метрик воркеров (нужен при нескольких процессах);
+# порог медленного запроса (сек.) и доля медленных запросов, для которых
+# в лог пишется выполненный SQL.
+METRICS_TOKEN = None
+METRICS_DIR = None
+METRICS_SLOW_REQUEST_SECONDS = 1.0
+METRICS_TRACE_SAMPLE_RATE = 0.0
+
+# Отдача файлов: 'django', 'x-accel-redirect' (nginx) или 'x-sendfile'.
+FILE_DELIVERY_MODE = 'django'
+FILE_DELIVERY_INTERNAL_URL = '/protected-media/'
+
+# Квота хранилища по умолчанию в байтах (None — без ограничения).
+# Индивидуальная квота задаётся полем User.quota_bytes.
+DEFAULT_STORAGE_QUOTA = None
+
+# Логи: JSON-строки в stdout, которые пишет отдельный поток (при переполнении
+# очереди записи отбрасываются, а не задерживают запросы). LOG_SAMPLING — доля
+# сохраняемых записей ниже WARNING по логгерам, например {'storage.views': 0.1};
+# LOG_RATE_LIMITS — не больше стольких записей в секунду по логгерам.
+# Для чтения глазами при разработке: 'formatter': 'verbose'.
+LOG_LEVEL = 'INFO'
+LOG_SAMPLING = {}
+LOG_RATE_LIMITS = {}
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -165,15 +251,30 @@ LOGGING = {
             'format': '[{asctime}] {levelname} {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'storage.logs.JsonFormatter',
+        },
+    },
+    'filters': {
+        'sampling': {
+            '()': 'storage.logs.SamplingFilter',
+        },
     },
     'handlers': {
         'console': {
-            'class': 'logging.StreamHandler',
-            'formatter': 'verbose',
+            'class': 'storage.logs.AsyncHandler',
+            'formatter': 'json',
+            'filters': ['sampling'],
         },
     },
     'root': {
         'handlers': ['console'],
-        'level': 'DEBUG',
+        'level': LOG_LEVEL,
+    },
+    'loggers': {
+        # Pillow подробно пишет разбор каждого изображения на DEBUG.
+        'PIL': {
+            'level': 'INFO',
+        },
     },
 }
@@ -0,0 +1,14 @@
+"""Настройки для ASGI-сервера (uvicorn).
+
+``WhiteNoiseMiddleware`` только синхронный: с ним Django переводит всю
+цепочку middleware в синхронный режим, и асинхронные представления
+выполняются через ``sync_to_async`` в общем потоке. Под ASGI статику
+отдаёт nginx.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import MIDDLEWARE
+
+MIDDLEWARE = [
+    middleware for middleware in MIDDLEWARE
+    if middleware != 'whitenoise.middleware.WhiteNoiseMiddleware'
+]
@@ -1,14 +1,21 @@
-import React, { useEffect, useState } from 'react';
+import React, { useCallback, useEffect, useState } from 'react';
 import API from '../api';
 import { Link } from 'react-router-dom';
 
 const AdminPanel = () => {
   const [users, setUsers] = useState([]);
   const [error, setError] = useState('');
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
-  useEffect(() => {
-    API.get('/users/', { withCredentials: true })
-      .then(res => setUsers(res.data))
+  // Список пользователей отдаётся постранично, следующая страница — по next_cursor
+  const fetchUsers = useCallback((cursor) => {
+    const url = cursor ? `/users/?cursor=${encodeURIComponent(cursor)}` : '/users/';
+    return API.get(url, { withCredentials: true })
+      .then(res => {
+        setUsers(prev => (cursor ? [...prev, ...res.data.users] : res.data.users));
+        setNextCursor(res.data.next_cursor || null);
+      })
       .catch(err => {
         setError(
           err.response?.data?.error
@@ -18,6 +25,15 @@ const AdminPanel = () => {
       });
   }, []);
 
+  useEffect(() => {
+    fetchUsers(null);
+  }, [fetchUsers]);
+
+  const handleLoadMore = () => {
+    setLoadingMore(true);
+    fetchUsers(nextCursor).finally(() => setLoadingMore(false));
+  };
+
   const handleDelete = async (id) => {
     if (!window.confirm('Удалить пользователя?')) return;
     try {
@@ -79,6 +95,11 @@ const AdminPanel = () => {
           ))}
         </tbody>
       </table>
+      {nextCursor && (
+        <button onClick={handleLoadMore} disabled={loadingMore}>
+          {loadingMore ? 'Загрузка...' : 'Показать ещё'}
+        </button>
+      )}
     </div>
   );
 };
@@ -154,6 +154,8 @@ const Dashboard = ({ userId }) => {
   const [editCommentValue, setEditCommentValue] = useState('');
   const [owner, setOwner] = useState(null);
   const [filesError, setFilesError] = useState(''); // новое состояние для ошибок загрузки файлов
+  const [nextCursor, setNextCursor] = useState(null); // курсор следующей страницы списка файлов
+  const [loadingMore, setLoadingMore] = useState(false);
 
   // Добавить проверку соединения с API
   const checkAPIConnection = useCallback(async () => {
@@ -170,19 +172,27 @@ const Dashboard = ({ userId }) => {
     }
   }, []);
 
+  // Сервер отдаёт список постранично: новые файлы первыми, дальше — по next_cursor
+  const filesUrl = useCallback((cursor) => {
+    const params = new URLSearchParams({ sort: '-upload_date' });
+    if (userId) params.set('user_id', userId);
+    if (cursor) params.set('cursor', cursor);
+    return `/files/?${params.toString()}`;
+  }, [userId]);
+
   const fetchFiles = useCallback(async () => {
     // Получение списка файлов пользователя или любого пользователя (если админ)
     // Сервер должен проверять права доступа и принимать user_id для админа
     try {
       setLoading(true);
       setFilesError('');
-      const url = userId ? `/files/?user_id=${userId}` : '/files/';
       // userId передаётся только если админ просматривает чужое хранилище
-      const res = await API.get(url);
+      const res = await API.get(filesUrl());
       // Сервер возвращает список файлов с метаданными:
       // original_name, size, upload_date, last_download, comment, storage_path, special_link
       const filesData = res.data.files || res.data || [];
       setFiles(Array.isArray(filesData) ? filesData : []);
+      setNextCursor(res.data.next_cursor || null);
       if (res.data.owner) setOwner(res.data.owner);
     } catch (error) {
       console.error('Fetch files error:', error);
@@ -204,10 +214,26 @@ const Dashboard = ({ userId }) => {
       }
       setMessage('');
       setFiles([]);
+      setNextCursor(null);
     } finally {
       setLoading(false);
     }
-  }, [userId]);
+  }, [filesUrl]);
+
+  const loadMoreFiles = async () => {
+    if (!nextCursor) return;
+    try {
+      setLoadingMore(true);
+      const res = await API.get(filesUrl(nextCursor));
+      setFiles(prev => [...prev, ...(res.data.files || [])]);
+      setNextCursor(res.data.next_cursor || null);
+    } catch (error) {
+      console.error('Load more files error:', error);
+      setFilesError('Ошибка загрузки списка файлов');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
 
   useEffect(() => {
     checkAPIConnection();
@@ -484,6 +510,11 @@ const Dashboard = ({ userId }) => {
             )}
           </tbody>
         </table>
+        {nextCursor && !filesError && (
+          <button style={styles.button} onClick={loadMoreFiles} disabled={loadingMore}>
+            {loadingMore ? 'Загрузка...' : 'Показать ещё'}
+          </button>
+        )}
         <img
           src="/kot.jpg"
           alt="Кот"
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, UserFile
+from .models import ScrubFinding, User, UserFile
 
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
@@ -14,3 +14,9 @@ class UserAdmin(BaseUserAdmin):
 class UserFileAdmin(admin.ModelAdmin):
     list_display = ('user', 'original_name', 'size', 'upload_date')
     search_fields = ('original_name', 'user__username')
+
+@admin.register(ScrubFinding)
+class ScrubFindingAdmin(admin.ModelAdmin):
+    list_display = ('sha256', 'kind', 'detected_at', 'resolved')
+    list_filter = ('kind', 'resolved')
+    search_fields = ('sha256',)
@@ -0,0 +1,131 @@
+"""Асинхронные варианты скачивания и загрузки файлов для ASGI (uvicorn).
+
+DRF не поддерживает асинхронные представления, поэтому здесь обычные
+async-представления Django. Токен проверяет тот же
+``CachedTokenAuthentication``, что и в синхронных представлениях (в пуле
+потоков), поэтому отозванный при выходе токен отклоняется одинаково.
+Тело запроса ASGI-обработчик Django принимает без занятия потока, а чтение
+файла при скачивании идёт блоками в пуле потоков (см.
+``downloads.afile_response``), так что медленный клиент не держит поток
+всё время передачи.
+"""
+import logging
+import os
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponseNotAllowed, JsonResponse
+from rest_framework import exceptions
+
+from . import blobs, download_stats, downloads, links, uploads, usage
+from .authentication import CachedTokenAuthentication
+from .models import UserFile
+from .upload_handlers import BlobUploadHandler
+
+logger = logging.getLogger(__name__)
+
+
+_token_authentication = CachedTokenAuthentication()
+_exists = sync_to_async(os.path.exists, thread_sensitive=False)
+
+
+def _authenticate_sync(request):
+    try:
+        result = _token_authentication.authenticate(request)
+    except exceptions.AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+async def _authenticate(request):
+    return await sync_to_async(_authenticate_sync)(request)
+
+
+async def _serve(request, file_id, file_path, original_name, content_hash, codec, size):
+    if not await _exists(file_path):
+        return JsonResponse({"error": "Файл не найден на сервере"}, status=404)
+    response = await downloads.afile_response(
+        request, file_path, original_name, content_hash=content_hash, codec=codec, size=size
+    )
+    if downloads.counts_as_download(request, response):
+        await sync_to_async(download_stats.record)(file_id)
+    return response
+
+
+async def file_download(request, file_id):
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET'])
+    user = await _authenticate(request)
+    if user is None:
+        return JsonResponse({"error": "Нет авторизации"}, status=401)
+    try:
+        user_file = await UserFile.objects.select_related('user', 'blob').aget(id=file_id)
+    except UserFile.DoesNotExist:
+        return JsonResponse({"error": "Файл не найден"}, status=404)
+    if not (user.is_admin or user_file.user_id == user.id):
+        return JsonResponse({"error": "Нет доступа"}, status=403)
+    return await _serve(
+        request, user_file.id, blobs.user_file_path(user_file),
+        user_file.original_name, user_file.blob_id,
+        user_file.blob.codec if user_file.blob_id else '', user_file.size,
+    )
+
+
+async def file_special_download(request, special_link):
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET'])
+    if await _authenticate(request) is None:
+        return JsonResponse({"error": "Нет авторизации"}, status=401)
+    link = await sync_to_async(links.resolve)(special_link)
+    if link is None:
+        return JsonResponse({"error": "Файл не найден"}, status=404)
+    if not await _exists(link.path):
+        # Запись в кэше могла устареть (файл сжат или удалён в другом процессе).
+        await sync_to_async(links.invalidate)(special_link)
+        link = await sync_to_async(links.resolve)(special_link)
+        if link is None:
+            return JsonResponse({"error": "Файл не найден"}, status=404)
+    return await _serve(
+        request, link.file_id, link.path, link.original_name,
+        link.validator, link.codec, link.size,
+    )
+
+
+def _save_from_request(request, user):
+    # Разбор multipart и перенос в хранилище — блокирующие операции.
+    handler = BlobUploadHandler(request)
+    request.upload_handlers = [handler]
+    try:
+        file = request.FILES.get('file')
+        if not file:
+            return None
+        return uploads.save_uploaded_file(user, file, request.POST.get('comment', ''))
+    finally:
+        handler.cleanup()
+
+
+async def file_upload(request):
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    user = await _authenticate(request)
+    if user is None:
+        return JsonResponse({"error": "Нет авторизации"}, status=401)
+    if not user.storage_path:
+        logger.error(f"У пользователя {user.username} отсутствует storage_path.")
+        return JsonResponse({"error": "Ошибка конфигурации пользователя"}, status=500)
+    try:
+        await sync_to_async(usage.check_request_body)(user, request.META.get('CONTENT_LENGTH'))
+        user_file = await sync_to_async(_save_from_request)(request, user)
+    except usage.QuotaExceeded:
+        return JsonResponse({"error": "Превышена квота хранилища"}, status=413)
+    except Exception as e:
+        logger.error(f"Ошибка сохранения файла: {str(e)}")
+        return JsonResponse({"error": "Ошибка сохранения файла"}, status=500)
+    if user_file is None:
+        logger.error("Файл не выбран или не передан в запросе")
+        return JsonResponse({"error": "Файл не выбран"}, status=400)
+    return JsonResponse({"message": "Файл загружен", "id": user_file.id, "sha256": user_file.blob_id})
+
+
+# Аутентификация по токену, CSRF-токен не используется. Атрибут задаётся
+# напрямую: декоратор csrf_exempt в Django 4.2 не поддерживает async-функции.
+file_upload.csrf_exempt = True
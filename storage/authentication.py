@@ -0,0 +1,86 @@
+"""Токен-аутентификация DRF с кэшированием пользователя.
+
+``TokenAuthentication`` на каждый запрос делает запрос token JOIN user.
+Здесь результат кэшируется в два уровня: LRU в памяти процесса с коротким
+TTL и общий кэш Django (``CACHES``: Redis, Memcached) с более длинным.
+Выход, смена прав и удаление пользователя вызывают ``invalidate_tokens``:
+запись удаляется из общего кэша и из LRU текущего процесса, в LRU остальных
+процессов она живёт не дольше ``AUTH_TOKEN_LOCAL_TTL`` секунд.
+
+Если ``CACHES`` не общий для процессов (по умолчанию ``LocMemCache``),
+второй уровень не используется: удаление из него не дошло бы до других
+воркеров, и они принимали бы отозванный токен ещё ``AUTH_TOKEN_CACHE_TTL``
+секунд.
+"""
+import copy
+import hashlib
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .caching import TTLCache, shared_cache
+
+LOCAL_SIZE = 10000
+LOCAL_TTL = 10
+SHARED_TTL = 300
+
+
+def _cache_key(key):
+    # Сам токен в ключах кэша не хранится.
+    return 'auth-token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+local_cache = TTLCache(
+    lambda: getattr(settings, 'AUTH_TOKEN_LOCAL_SIZE', LOCAL_SIZE),
+    lambda: getattr(settings, 'AUTH_TOKEN_LOCAL_TTL', LOCAL_TTL),
+)
+
+
+def _lookup(key):
+    cache_key = _cache_key(key)
+    user = local_cache.get(cache_key)
+    if user is not None:
+        return user
+    shared = shared_cache()
+    user = shared.get(cache_key) if shared is not None else None
+    if user is None:
+        try:
+            token = Token.objects.select_related('user').get(key=key)
+        except Token.DoesNotExist:
+            return None
+        user = token.user
+        if shared is not None:
+            shared.set(cache_key, user, getattr(settings, 'AUTH_TOKEN_CACHE_TTL', SHARED_TTL))
+    local_cache.set(cache_key, user)
+    return user
+
+
+def invalidate_tokens(keys):
+    """Сбрасывает закэшированных пользователей для указанных токенов."""
+    cache_keys = [_cache_key(key) for key in keys]
+    for cache_key in cache_keys:
+        local_cache.discard(cache_key)
+    shared = shared_cache()
+    if cache_keys and shared is not None:
+        shared.delete_many(cache_keys)
+
+
+def invalidate_user(user):
+    invalidate_tokens(Token.objects.filter(user=user).values_list('key', flat=True))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Замена ``TokenAuthentication`` для ``DEFAULT_AUTHENTICATION_CLASSES``."""
+
+    def authenticate_credentials(self, key):
+        user = _lookup(key)
+        if user is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        # Копия, чтобы изменения request.user не попадали в общий кэш.
+        user = copy.copy(user)
+        return (user, Token(key=key, user=user))
@@ -0,0 +1,182 @@
+"""Пакетные операции над файлами: удаление, переименование, комментарий, перенос.
+
+Все файлы пакета загружаются одним запросом, изменения метаданных пишутся
+через ``bulk_update`` в одной транзакции, а файлы на диске удаляются или
+переносятся только после её фиксации.
+"""
+import logging
+import os
+
+from django.conf import settings
+from django.db import transaction
+
+from . import blobs, links, usage
+from .models import User, UserFile
+
+logger = logging.getLogger(__name__)
+
+MAX_OPERATIONS = 1000
+OPERATIONS = ('delete', 'rename', 'comment', 'move')
+
+
+class BatchError(ValueError):
+    pass
+
+
+def _result(index, op, file_id, status, error=None):
+    result = {"index": index, "op": op, "id": file_id, "status": status}
+    if error:
+        result["error"] = error
+    return result
+
+
+def _validate(operations):
+    limit = getattr(settings, 'BATCH_MAX_OPERATIONS', MAX_OPERATIONS)
+    if not isinstance(operations, list) or not operations:
+        raise BatchError('Список операций пуст')
+    if len(operations) > limit:
+        raise BatchError(f'Не более {limit} операций за запрос')
+    for operation in operations:
+        if not isinstance(operation, dict):
+            raise BatchError('Операция должна быть объектом')
+
+
+def _remove_after_commit(path):
+    def remove():
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except OSError as e:
+            logger.error(f"Не удалось удалить файл {path}: {str(e)}")
+    transaction.on_commit(remove)
+
+
+def _move_after_commit(src, dst):
+    def move():
+        try:
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            os.replace(src, dst)
+        except OSError as e:
+            logger.error(f"Не удалось перенести файл {src} -> {dst}: {str(e)}")
+    transaction.on_commit(move)
+
+
+def apply_operations(request_user, operations):
+    """Выполняет операции и возвращает результат по каждой из них."""
+    _validate(operations)
+
+    file_ids = {_int_or_none(operation.get('id')) for operation in operations}
+    target_ids = {
+        _int_or_none(operation.get('to_user_id'))
+        for operation in operations if operation.get('op') == 'move'
+    }
+    file_ids.discard(None)
+    target_ids.discard(None)
+
+    files = {
+        f.id: f
+        for f in UserFile.objects.select_related('user').filter(id__in=file_ids)
+    }
+    owners = {file_id: user_file.user_id for file_id, user_file in files.items()}
+    targets = {}
+    if target_ids and request_user.is_admin:
+        targets = {u.id: u for u in User.objects.filter(id__in=target_ids)}
+
+    results = []
+    deleted = {}
+    changed = {}
+    moves = {}
+    for index, operation in enumerate(operations):
+        op = operation.get('op')
+        file_id = operation.get('id')
+        if op not in OPERATIONS:
+            results.append(_result(index, op, file_id, 400, 'Неизвестная операция'))
+            continue
+        file_id = _int_or_none(file_id)
+        if file_id is None:
+            results.append(_result(index, op, operation.get('id'), 400, 'Некорректный id файла'))
+            continue
+        user_file = files.get(file_id)
+        if user_file is None or file_id in deleted:
+            results.append(_result(index, op, file_id, 404, 'Файл не найден'))
+            continue
+        if not (request_user.is_admin or user_file.user_id == request_user.id):
+            results.append(_result(index, op, file_id, 403, 'Нет доступа'))
+            continue
+
+        if op == 'delete':
+            deleted[file_id] = user_file
+            changed.pop(file_id, None)
+        elif op == 'rename':
+            new_name = operation.get('new_name')
+            if not new_name or not isinstance(new_name, str):
+                results.append(_result(index, op, file_id, 400, 'Новое имя не указано'))
+                continue
+            user_file.original_name = new_name
+            changed[file_id] = user_file
+        elif op == 'comment':
+            comment = operation.get('comment', '') or ''
+            if not isinstance(comment, str):
+                results.append(_result(index, op, file_id, 400, 'Некорректный комментарий'))
+                continue
+            user_file.comment = comment
+            changed[file_id] = user_file
+        elif op == 'move':
+            if not request_user.is_admin:
+                results.append(_result(index, op, file_id, 403, 'Доступ запрещён'))
+                continue
+            target = targets.get(_int_or_none(operation.get('to_user_id')))
+            if target is None:
+                results.append(_result(index, op, file_id, 404, 'Пользователь не найден'))
+                continue
+            if target.id != user_file.user_id:
+                if not user_file.blob_id:
+                    src = moves.get(file_id, (blobs.legacy_file_path(user_file),))[0]
+                    moves[file_id] = (src, blobs.legacy_file_path(user_file, target))
+                user_file.user = target
+                changed[file_id] = user_file
+        results.append(_result(index, op, file_id, 200))
+
+    # Счётчики считаются от исходного владельца: файл могли перенести
+    # несколько раз или перенести и удалить в одном пакете.
+    deltas = {}
+    for file_id, user_file in deleted.items():
+        _add_delta(deltas, owners[file_id], -1, -user_file.size)
+    for file_id, user_file in changed.items():
+        if user_file.user_id != owners[file_id]:
+            _add_delta(deltas, owners[file_id], -1, -user_file.size)
+            _add_delta(deltas, user_file.user_id, 1, user_file.size)
+
+    with transaction.atomic():
+        usage.apply_deltas(deltas)
+        if changed:
+            UserFile.objects.bulk_update(
+                list(changed.values()), ['original_name', 'comment', 'user']
+            )
+        if deleted:
+            delete_qs = UserFile.objects.filter(id__in=list(deleted))
+            blobs.release(blobs.blob_counts(delete_qs))
+            for file_id, user_file in deleted.items():
+                if not user_file.blob_id:
+                    # Файл, перенесённый и удалённый в одном пакете, ещё лежит на старом месте.
+                    path = moves.pop(file_id, (blobs.legacy_file_path(user_file),))[0]
+                    _remove_after_commit(path)
+            delete_qs.delete()
+        for src, dst in moves.values():
+            _move_after_commit(src, dst)
+        stale_links = [files[file_id].special_link for file_id in (*deleted, *changed)]
+        if stale_links:
+            transaction.on_commit(lambda: links.invalidate(*stale_links))
+    return results
+
+
+def _add_delta(deltas, user_id, files, size):
+    current_files, current_size = deltas.get(user_id, (0, 0))
+    deltas[user_id] = (current_files + files, current_size + size)
+
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,315 @@
+"""Хранилище содержимого файлов с адресацией по SHA-256 (дедупликация).
+
+Одинаковое содержимое хранится на диске один раз в
+``MEDIA_ROOT/blobs/ab/cd/<sha256>`` (``<sha256>.gz`` для сжатого, см.
+``storage.compression``), а записи ``UserFile`` ссылаются на общий
+``Blob`` со счётчиком ссылок. Байты удаляются, когда счётчик доходит до нуля.
+
+Строки ``Blob`` с нулевым счётчиком не удаляются сразу: блокировка этой строки
+сериализует загрузку того же содержимого и удаление байтов. Пустые строки
+убирает ``purge_unreferenced``.
+
+``ingest`` кладёт байты в хранилище до фиксации транзакции, поэтому
+вызывается внутри ``blobs.atomic()``: при откате положенные байты удаляются.
+
+Файлы, ещё не перенесённые в хранилище blob'ов, лежат в каталоге
+пользователя, разложенные по подкаталогам из первых символов
+``stored_name`` (``STORAGE_FANOUT_LEVELS`` уровней, по умолчанию
+``ab/cd/<stored_name>``), чтобы в одном каталоге не было сотен тысяч
+записей. Все пути строит ``fanout_path``. Пока ``migrate_user_files_layout``
+не переложил файл, он находится по старому плоскому пути.
+"""
+import contextvars
+import hashlib
+import logging
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from . import compression, previews
+from .models import Blob, UserFile
+
+logger = logging.getLogger(__name__)
+
+HASH_BLOCK_SIZE = 1024 * 1024
+MAX_FANOUT_LEVELS = 4
+
+# (sha256, кодек) байтов, положенных ``ingest`` в текущем ``atomic()``.
+_placed = contextvars.ContextVar('blobs_placed', default=None)
+
+
+def blobs_root():
+    return os.path.join(settings.MEDIA_ROOT, 'blobs')
+
+
+def fanout_levels():
+    return getattr(settings, 'STORAGE_FANOUT_LEVELS', 2)
+
+
+def fanout_path(root, key, name, levels):
+    """``root/<key[0:2]>/<key[2:4]>/.../name`` — ``levels`` уровней по два символа."""
+    return os.path.join(root, *(key[i * 2:i * 2 + 2] for i in range(levels)), name)
+
+
+def blob_path(sha256, codec=''):
+    return fanout_path(blobs_root(), sha256, sha256 + compression.SUFFIXES.get(codec, ''), 2)
+
+
+def user_root(user):
+    return os.path.join(settings.MEDIA_ROOT, user.storage_path)
+
+
+def legacy_file_path(user_file, user=None, levels=None):
+    """Путь к файлу в каталоге пользователя.
+
+    Без ``levels`` — по текущей раскладке, а если файла там нет, но он лежит
+    по пути прежней раскладки (ещё не перенесён), — этот путь.
+    """
+    user = user or user_file.user
+    if levels is not None:
+        return fanout_path(user_root(user), user_file.stored_name, user_file.stored_name, levels)
+    current = fanout_levels()
+    path = legacy_file_path(user_file, user, current)
+    if not os.path.exists(path):
+        for old_levels in range(MAX_FANOUT_LEVELS + 1):
+            old_path = legacy_file_path(user_file, user, old_levels)
+            if old_levels != current and os.path.exists(old_path):
+                return old_path
+    return path
+
+
+def remove_empty_dirs(root):
+    """Удаляет пустые подкаталоги ``root`` и сам ``root``, если он опустел."""
+    for path, _, _ in os.walk(root, topdown=False):
+        try:
+            os.rmdir(path)
+        except OSError:
+            pass
+
+
+def user_file_path(user_file, user=None):
+    """Абсолютный путь к содержимому файла пользователя на диске."""
+    if user_file.blob_id:
+        return blob_path(user_file.blob_id, user_file.blob.codec)
+    return legacy_file_path(user_file, user)
+
+
+def open_user_file(user_file):
+    """Открывает содержимое файла пользователя на чтение (распакованным)."""
+    codec = user_file.blob.codec if user_file.blob_id else ''
+    return compression.open_stored(user_file_path(user_file), codec)
+
+
+def temp_path():
+    tmp_dir = os.path.join(blobs_root(), 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+    return os.path.join(tmp_dir, f'{uuid.uuid4().hex}.tmp')
+
+
+def write_temp(chunks):
+    """Записывает поток во временный файл, считая SHA-256 на лету.
+
+    Возвращает ``(путь, sha256, размер)``.
+    """
+    path = temp_path()
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, 'wb') as dest:
+            for chunk in chunks:
+                digest.update(chunk)
+                size += len(chunk)
+                dest.write(chunk)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return path, digest.hexdigest(), size
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as src:
+        for block in iter(lambda: src.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def prepare(path, sha256, size, name=None):
+    """Сжимает файл перед ``ingest``, если включено сжатие и оно оправдано.
+
+    Вызывается вне транзакции: сжатие долгое. Возвращает ``(путь, кодек,
+    физический размер)``; исходный файл при сжатии удаляется.
+    """
+    if not compression.enabled() or Blob.objects.filter(sha256=sha256, ref_count__gt=0).exists():
+        return path, '', size
+    if not compression.is_compressible(path, name):
+        return path, '', size
+    compressed = temp_path()
+    stored_size = compression.compress_file(path, compressed)
+    if not compression.worthwhile(stored_size, size):
+        os.remove(compressed)
+        return path, '', size
+    os.remove(path)
+    return compressed, compression.CODEC_GZIP, stored_size
+
+
+@contextmanager
+def atomic():
+    """``transaction.atomic()``, после отката которого удаляются байты,
+    положенные в хранилище ``ingest`` внутри блока."""
+    outer = _placed.get()
+    placed = []
+    token = _placed.set(placed)
+    try:
+        with transaction.atomic():
+            yield
+    except BaseException:
+        for sha256, codec in placed:
+            _discard_placed(sha256, codec)
+        raise
+    finally:
+        _placed.reset(token)
+    if outer is not None:
+        # Вложенный блок зафиксирован в транзакции внешнего: откат внешнего
+        # тоже должен убрать эти байты.
+        outer.extend(placed)
+
+
+def _discard_placed(sha256, codec):
+    with transaction.atomic():
+        # Строка-якорь дожидается параллельной загрузки того же содержимого:
+        # если она зафиксировалась, байты уже используются.
+        blob, created = Blob.objects.select_for_update().get_or_create(
+            sha256=sha256, defaults={'size': 0, 'codec': codec, 'stored_size': 0, 'ref_count': 0}
+        )
+        if blob.ref_count > 0 and blob.codec == codec:
+            return
+        try:
+            os.remove(blob_path(sha256, codec))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Не удалось удалить blob {sha256} после отката: {str(e)}")
+        if created:
+            blob.delete()
+
+
+def ingest(path, sha256, size, codec='', stored_size=None):
+    """Забирает файл ``path`` в хранилище и увеличивает счётчик ссылок.
+
+    Должна вызываться внутри ``blobs.atomic()``. Если такое содержимое
+    уже есть, ``path`` удаляется. Возвращает ``Blob``.
+    """
+    stored_size = size if stored_size is None else stored_size
+    # Содержимое только что хешировано, поэтому оно считается проверенным.
+    checked_at = timezone.now()
+    blob, created = Blob.objects.select_for_update().get_or_create(
+        sha256=sha256,
+        defaults={'size': size, 'codec': codec, 'stored_size': stored_size, 'checked_at': checked_at},
+    )
+    if os.path.exists(blob_path(sha256, blob.codec)):
+        os.remove(path)
+    else:
+        # Строка без байтов (счётчик дошёл до нуля): кладём новые.
+        target = blob_path(sha256, codec)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(path, target)
+        placed = _placed.get()
+        if placed is not None:
+            placed.append((sha256, codec))
+        if not created:
+            blob.codec, blob.stored_size, blob.checked_at = codec, stored_size, checked_at
+            blob.save(update_fields=['codec', 'stored_size', 'checked_at'])
+    Blob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+    blob.ref_count += 1
+    return blob
+
+
+def _remove_if_unreferenced(sha256):
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(sha256=sha256).first()
+        if blob is None or blob.ref_count > 0:
+            return
+        path = blob_path(sha256, blob.codec)
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+            previews.discard(sha256)
+        except OSError as e:
+            logger.error(f"Не удалось удалить blob {sha256}: {str(e)}")
+
+
+def release(blob_counts):
+    """Уменьшает счётчики ссылок ``{sha256: n}``.
+
+    Байты содержимого без ссылок удаляются после фиксации транзакции.
+    """
+    for sha256, count in blob_counts.items():
+        Blob.objects.filter(sha256=sha256).update(ref_count=F('ref_count') - count)
+        transaction.on_commit(lambda sha256=sha256: _remove_if_unreferenced(sha256))
+
+
+def blob_counts(user_files):
+    """Число ссылок на каждый blob среди переданного queryset ``UserFile``."""
+    return dict(
+        user_files.exclude(blob__isnull=True)
+        .values('blob')
+        .annotate(n=Count('id'))
+        .values_list('blob', 'n')
+    )
+
+
+def purge_unreferenced():
+    """Удаляет строки ``Blob`` без ссылок вместе с их байтами."""
+    purged = 0
+    for sha256 in Blob.objects.filter(ref_count=0).values_list('sha256', flat=True):
+        with transaction.atomic():
+            blob = Blob.objects.select_for_update().filter(sha256=sha256).first()
+            if blob is None or blob.ref_count > 0:
+                continue
+            path = blob_path(sha256, blob.codec)
+            if os.path.exists(path):
+                os.remove(path)
+            previews.discard(sha256)
+            blob.delete()
+            purged += 1
+    return purged
+
+
+def convert_legacy(user_file):
+    """Переносит файл из каталога пользователя в хранилище blob'ов."""
+    path = legacy_file_path(user_file)
+    sha256 = hash_file(path)
+    # В хранилище уходит копия (жёсткая ссылка, если каталоги на одном диске),
+    # а сам файл удаляется только после фиксации: при откате он остаётся на месте.
+    tmp_path = temp_path()
+    try:
+        os.link(path, tmp_path)
+    except OSError:
+        shutil.copyfile(path, tmp_path)
+    try:
+        with atomic():
+            user_file = UserFile.objects.select_for_update().get(pk=user_file.pk)
+            if user_file.blob_id:
+                return False
+            blob = ingest(tmp_path, sha256, os.path.getsize(tmp_path))
+            UserFile.objects.filter(pk=user_file.pk).update(blob=blob)
+            transaction.on_commit(lambda: _remove_legacy(path))
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return True
+
+
+def _remove_legacy(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,69 @@
+"""Ограниченный по размеру кэш в памяти процесса с временем жизни записей."""
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def shared_cache():
+    """Кэш Django ``default``, если он общий для процессов сервера, иначе ``None``.
+
+    Без ``CACHES`` Django использует ``LocMemCache`` — отдельный в каждом
+    процессе: удаление записи в нём не видят остальные воркеры.
+    """
+    backend = caches[DEFAULT_CACHE_ALIAS]
+    if isinstance(backend, (LocMemCache, DummyCache)):
+        return None
+    return backend
+
+
+class TTLCache:
+    """Потокобезопасный LRU: не больше ``max_size`` записей, каждая живёт ``ttl`` секунд.
+
+    Размер и TTL передаются функциями, чтобы настройки читались при каждом
+    обращении (в том числе переопределённые в тестах).
+    """
+
+    def __init__(self, max_size, ttl):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[1] < time.monotonic():
+                del self._items[key]
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = (value, time.monotonic() + self._ttl())
+            self._items.move_to_end(key)
+            max_size = self._max_size()
+            while len(self._items) > max_size:
+                self._items.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._items), "hits": self.hits, "misses": self.misses}
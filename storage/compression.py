@@ -0,0 +1,135 @@
+"""Необязательное сжатие содержимого blob'ов на диске (gzip).
+
+Включается настройкой ``STORAGE_COMPRESSION``. Сжимается только то, что
+хорошо сжимается: файл не меньше ``STORAGE_COMPRESSION_MIN_SIZE``, без
+сигнатуры известного сжатого формата и с пробным сжатием начала файла
+хотя бы на ``SAMPLE_MAX_RATIO``. Сжатый blob хранится рядом с несжатым
+путём с суффиксом кодека (см. ``blobs.blob_path``), логический размер
+остаётся в ``Blob.size``, физический — в ``Blob.stored_size``.
+"""
+import gzip
+import os
+import shutil
+import zlib
+
+from django.conf import settings
+
+CODEC_GZIP = 'gzip'
+SUFFIXES = {CODEC_GZIP: '.gz'}
+
+MIN_SIZE = 4096
+LEVEL = 6
+SAMPLE_SIZE = 64 * 1024
+SAMPLE_MAX_RATIO = 0.8
+# Сжатая копия сохраняется, только если она заметно меньше исходной.
+MAX_RATIO = 0.9
+READ_BLOCK_SIZE = 64 * 1024
+
+STORED_EXTENSIONS = {
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.avif', '.heic',
+    '.mp4', '.mov', '.avi', '.mkv', '.webm', '.mp3', '.aac', '.ogg',
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.rar', '.zst',
+    '.docx', '.xlsx', '.pptx', '.odt', '.ods',
+}
+
+MAGIC_NUMBERS = (
+    b'\x1f\x8b',            # gzip
+    b'PK\x03\x04',          # zip, docx, xlsx, odt
+    b'BZh',                 # bzip2
+    b'\xfd7zXZ\x00',        # xz
+    b'\x28\xb5\x2f\xfd',    # zstd
+    b'7z\xbc\xaf\x27\x1c',  # 7z
+    b'Rar!',
+    b'\x89PNG',
+    b'\xff\xd8\xff',        # jpeg
+    b'GIF8',
+    b'RIFF',                # webp, avi, wav
+    b'OggS',
+    b'fLaC',
+    b'ID3',                 # mp3
+    b'\x1a\x45\xdf\xa3',    # mkv, webm
+)
+
+
+def enabled():
+    return getattr(settings, 'STORAGE_COMPRESSION', False)
+
+
+def _looks_compressed(head):
+    # MP4/MOV/HEIC: сигнатура ftyp со смещением 4.
+    return head.startswith(MAGIC_NUMBERS) or head[4:8] == b'ftyp'
+
+
+def is_compressible(path, name=None):
+    """Стоит ли сжимать файл: размер, расширение, сигнатура и пробное сжатие."""
+    if os.path.getsize(path) < getattr(settings, 'STORAGE_COMPRESSION_MIN_SIZE', MIN_SIZE):
+        return False
+    if name and os.path.splitext(name)[1].lower() in STORED_EXTENSIONS:
+        return False
+    with open(path, 'rb') as src:
+        sample = src.read(SAMPLE_SIZE)
+    if _looks_compressed(sample):
+        return False
+    return len(zlib.compress(sample, 1)) <= len(sample) * SAMPLE_MAX_RATIO
+
+
+def compress_file(src_path, dest_path):
+    """Сжимает ``src_path`` в ``dest_path`` и возвращает размер результата."""
+    level = getattr(settings, 'STORAGE_COMPRESSION_LEVEL', LEVEL)
+    try:
+        with open(src_path, 'rb') as src, open(dest_path, 'wb') as raw:
+            # mtime=0: одинаковое содержимое даёт одинаковые байты.
+            with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=level, mtime=0) as dest:
+                shutil.copyfileobj(src, dest, READ_BLOCK_SIZE)
+    except BaseException:
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        raise
+    return os.path.getsize(dest_path)
+
+
+def worthwhile(stored_size, size):
+    return stored_size <= size * MAX_RATIO
+
+
+def open_stored(path, codec):
+    """Открывает содержимое blob'а на чтение с распаковкой на лету."""
+    if codec == CODEC_GZIP:
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def iter_decompressed(path, codec, start=0, end=None):
+    """Блоки распакованного содержимого в диапазоне ``[start, end]``.
+
+    Переход к ``start`` требует распаковки всего предшествующего содержимого.
+    """
+    with open_stored(path, codec) as src:
+        if start:
+            src.seek(start)
+        remaining = None if end is None else end - start + 1
+        while remaining is None or remaining > 0:
+            size = READ_BLOCK_SIZE if remaining is None else min(READ_BLOCK_SIZE, remaining)
+            block = src.read(size)
+            if not block:
+                break
+            if remaining is not None:
+                remaining -= len(block)
+            yield block
+
+
+def accepts(request, codec):
+    """Принимает ли клиент ``Content-Encoding: codec`` (с учётом ``q=0``)."""
+    header = request.headers.get('Accept-Encoding', '')
+    for item in header.split(','):
+        token, _, params = item.strip().partition(';')
+        if token.strip().lower() not in (codec, '*'):
+            continue
+        params = params.strip().replace(' ', '')
+        if params.startswith('q='):
+            try:
+                return float(params[2:]) > 0
+            except ValueError:
+                return False
+        return True
+    return False
@@ -0,0 +1,142 @@
+"""Отложенная пакетная запись статистики скачиваний.
+
+Вместо ``user_file.save()`` на каждое скачивание события копятся в памяти
+процесса и сбрасываются фоновым потоком одним ``UPDATE`` на пакет:
+``last_download`` получает максимум из сохранённого и накопленного значения,
+``download_count`` увеличивается на число скачиваний.
+
+Настройки:
+
+* ``DOWNLOAD_STATS_FLUSH_INTERVAL`` — период сброса в секундах (2);
+* ``DOWNLOAD_STATS_MAX_LAG`` — если самое старое событие ждёт дольше,
+  сброс выполняется сразу в потоке запроса (10);
+* ``DOWNLOAD_STATS_BUFFERED`` — ``False`` отключает буфер, запись сразу.
+
+При завершении процесса накопленные события сбрасываются через ``atexit``.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Case, DateTimeField, F, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import UserFile
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 2.0
+MAX_LAG = 10.0
+BATCH_SIZE = 500
+
+
+def write_batch(events):
+    """Записывает ``{file_id: (последнее скачивание, число)}`` одним UPDATE на пакет."""
+    items = list(events.items())
+    for offset in range(0, len(items), BATCH_SIZE):
+        batch = items[offset:offset + BATCH_SIZE]
+        UserFile.objects.filter(id__in=[file_id for file_id, _ in batch]).update(
+            last_download=Case(
+                *[
+                    When(id=file_id, then=Greatest(
+                        Coalesce(F('last_download'), Value(when)), Value(when)
+                    ))
+                    for file_id, (when, _) in batch
+                ],
+                output_field=DateTimeField(),
+            ),
+            download_count=F('download_count') + Case(
+                *[When(id=file_id, then=Value(count)) for file_id, (_, count) in batch],
+                default=Value(0),
+            ),
+        )
+
+
+class DownloadRecorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._oldest = None
+        self._thread = None
+        self._pid = None
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'DOWNLOAD_STATS_FLUSH_INTERVAL', FLUSH_INTERVAL)
+
+    @property
+    def max_lag(self):
+        return getattr(settings, 'DOWNLOAD_STATS_MAX_LAG', MAX_LAG)
+
+    def record(self, file_id, when=None):
+        self.record_many([file_id], when)
+
+    def record_many(self, file_ids, when=None):
+        when = when or timezone.now()
+        if not getattr(settings, 'DOWNLOAD_STATS_BUFFERED', True):
+            write_batch({file_id: (when, 1) for file_id in file_ids})
+            return
+        with self._lock:
+            for file_id in file_ids:
+                last, count = self._pending.get(file_id, (when, 0))
+                self._pending[file_id] = (max(last, when), count + 1)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            overdue = time.monotonic() - self._oldest > self.max_lag
+        self._ensure_thread()
+        if overdue:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._oldest = None
+        if not pending:
+            return 0
+        try:
+            write_batch(pending)
+        except Exception as e:
+            logger.error(f"Ошибка записи статистики скачиваний: {str(e)}")
+            self._requeue(pending)
+            return 0
+        return len(pending)
+
+    def _requeue(self, pending):
+        with self._lock:
+            for file_id, (when, count) in pending.items():
+                last, current = self._pending.get(file_id, (when, 0))
+                self._pending[file_id] = (max(last, when), current + count)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+
+    def _ensure_thread(self):
+        # После fork() поток родителя не существует: запускаем свой в каждом процессе.
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name='download-stats-flusher', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            finally:
+                connections.close_all()
+
+
+recorder = DownloadRecorder()
+record = recorder.record
+record_many = recorder.record_many
+atexit.register(recorder.flush)
@@ -0,0 +1,482 @@
+"""Отдача файлов с поддержкой Range, ETag и условных GET-запросов.
+
+Режим отдачи задаётся настройкой ``FILE_DELIVERY_MODE``:
+
+* ``'django'`` (по умолчанию) — байты отдаёт Django через ``FileResponse``;
+  под gunicorn это ``os.sendfile`` через ``wsgi.file_wrapper``;
+* ``'x-accel-redirect'`` — nginx отдаёт файл из internal-location
+  ``FILE_DELIVERY_INTERNAL_URL``, сопоставленной с ``MEDIA_ROOT``;
+* ``'x-sendfile'`` — Apache/lighttpd отдаёт файл по абсолютному пути.
+"""
+import asyncio
+import mimetypes
+import os
+import uuid
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import (content_disposition_header, http_date,
+                               parse_etags, parse_http_date_safe, quote_etag)
+
+from . import compression
+
+READ_BLOCK_SIZE = 64 * 1024
+ASYNC_READ_BLOCK_SIZE = 256 * 1024
+MAX_RANGES = 16
+
+DELIVERY_DJANGO = 'django'
+DELIVERY_X_ACCEL = 'x-accel-redirect'
+DELIVERY_X_SENDFILE = 'x-sendfile'
+
+
+class RangeFile:
+    """Файловый объект, ограниченный диапазоном ``[start, end]`` исходного файла.
+
+    Сохраняет ``fileno()``, поэтому WSGI-сервер с ``wsgi.file_wrapper``
+    (gunicorn) отдаёт диапазон через ``os.sendfile`` с текущей позиции
+    дескриптора и ``Content-Length``, без копирования в пространство Python.
+    """
+
+    def __init__(self, file_obj, start, end):
+        self._file = file_obj
+        self._start = start
+        self._length = end - start + 1
+        self._pos = 0
+        self.name = getattr(file_obj, 'name', '')
+        file_obj.seek(start)
+
+    def read(self, size=-1):
+        remaining = self._length - self._pos
+        if remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        data = self._file.read(size)
+        self._pos += len(data)
+        return data
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self._pos, os.SEEK_END: self._length}[whence]
+        self._pos = base + offset
+        self._file.seek(self._start + self._pos)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def seekable(self):
+        return True
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def close(self):
+        self._file.close()
+
+
+def delivery_mode():
+    return getattr(settings, 'FILE_DELIVERY_MODE', DELIVERY_DJANGO)
+
+
+def _offload_response(path, filename, content_type):
+    mode = delivery_mode()
+    response = HttpResponse(content_type=content_type)
+    if mode == DELIVERY_X_ACCEL:
+        internal_url = getattr(settings, 'FILE_DELIVERY_INTERNAL_URL', '/protected-media/')
+        relative = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
+        response['X-Accel-Redirect'] = internal_url.rstrip('/') + '/' + quote(relative)
+    else:
+        response['X-Sendfile'] = os.fsencode(os.path.abspath(path)).decode('latin-1')
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    return response
+
+
+def make_etag(stat_result, content_hash=None):
+    """Дешёвый валидатор: SHA-256 содержимого, если он известен, иначе размер и mtime."""
+    if content_hash:
+        return quote_etag(content_hash)
+    return quote_etag(f'{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}')
+
+
+def _strip_weak(etag):
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def _none_match(header, etag):
+    if header is None:
+        return False
+    etags = parse_etags(header)
+    if '*' in etags:
+        return True
+    return _strip_weak(etag) in {_strip_weak(tag) for tag in etags}
+
+
+def etag_matches(request, etag):
+    """Есть ли ``etag`` в ``If-None-Match`` запроса (ответ можно не отдавать)."""
+    return _none_match(request.headers.get('If-None-Match'), etag)
+
+
+def counts_as_download(request, response):
+    """Учитывать ли ответ в статистике скачиваний.
+
+    Докачка и перемотка видео присылают много запросов диапазонов на одно
+    скачивание, поэтому считается только полный ответ или диапазон с начала
+    файла.
+    """
+    if request.method != 'GET':
+        return False
+    if response.status_code == 200:
+        if response.has_header('X-Accel-Redirect') or response.has_header('X-Sendfile'):
+            # Диапазон отдаёт веб-сервер, ответ Django для него тоже 200.
+            return _range_from_start(request.headers.get('Range'))
+        return True
+    return response.status_code == 206 and response.get('Content-Range', '').startswith('bytes 0-')
+
+
+def _range_from_start(header):
+    """Нет заголовка Range или первый диапазон в нём начинается с нулевого байта."""
+    if not header:
+        return True
+    units, _, specs = header.partition('=')
+    if units.strip().lower() != 'bytes':
+        # Такой Range веб-сервер игнорирует и отдаёт файл целиком.
+        return True
+    return specs.split(',')[0].strip().startswith('0-')
+
+
+def _range_allowed(request, etag, mtime):
+    """Проверка If-Range: частичный ответ только для неизменённого файла."""
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        # Для If-Range допускается только строгое сравнение: слабые теги не совпадают.
+        return if_range == etag
+    since = parse_http_date_safe(if_range)
+    return since is not None and int(mtime) == since
+
+
+def parse_range(header, size):
+    """Разбирает ``Range: bytes=...``.
+
+    Возвращает список пар (начало, конец включительно), пустой список для
+    неудовлетворимого диапазона или ``None``, если заголовок нужно игнорировать.
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not spec:
+        return None
+    ranges = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        start, sep, end = part.partition('-')
+        if not sep:
+            return None
+        try:
+            if start.strip() == '':
+                length = int(end)
+                if length <= 0:
+                    continue
+                start_pos, end_pos = max(size - length, 0), size - 1
+            else:
+                start_pos = int(start)
+                end_pos = int(end) if end.strip() else size - 1
+                if end.strip() and end_pos < start_pos:
+                    return None
+                end_pos = min(end_pos, size - 1)
+        except ValueError:
+            return None
+        if start_pos >= size:
+            continue
+        ranges.append((start_pos, end_pos))
+    if len(ranges) > MAX_RANGES:
+        return None
+    return ranges
+
+
+def _read_range(file_obj, start, end):
+    file_obj.seek(start)
+    remaining = end - start + 1
+    while remaining > 0:
+        block = file_obj.read(min(READ_BLOCK_SIZE, remaining))
+        if not block:
+            break
+        remaining -= len(block)
+        yield block
+
+
+def _multipart_ranges(file_obj, segments, closing):
+    try:
+        for header, start, end in segments:
+            yield header
+            yield from _read_range(file_obj, start, end)
+            yield b'\r\n'
+        yield closing
+    finally:
+        file_obj.close()
+
+
+def _set_validators(response, etag, mtime):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(mtime)
+    response['Accept-Ranges'] = 'bytes'
+
+
+def _multipart_layout(ranges, size, content_type):
+    boundary = uuid.uuid4().hex
+    segments = []
+    length = 0
+    for start, end in ranges:
+        header = (
+            f'--{boundary}\r\n'
+            f'Content-Type: {content_type}\r\n'
+            f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n'
+        ).encode()
+        segments.append((header, start, end))
+        length += len(header) + (end - start + 1) + 2
+    closing = f'--{boundary}--\r\n'.encode()
+    length += len(closing)
+    return boundary, segments, closing, length
+
+
+def _not_modified(request, etag, mtime):
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        return _none_match(if_none_match, etag)
+    since = parse_http_date_safe(request.headers.get('If-Modified-Since') or '')
+    return since is not None and int(mtime) <= since
+
+
+def _plan(request, path, filename, content_hash):
+    """Общая часть синхронной и асинхронной отдачи.
+
+    Возвращает ``(готовый ответ, None)`` для 304/416/offload или
+    ``(None, (size, content_type, ranges, validators))`` для отдачи байтов,
+    где ``ranges`` — ``None`` для полного файла.
+    """
+    stat_result = os.stat(path)
+    size = stat_result.st_size
+    mtime = stat_result.st_mtime
+    etag = make_etag(stat_result, content_hash)
+
+    if _not_modified(request, etag, mtime):
+        response = HttpResponse(status=304)
+        _set_validators(response, etag, mtime)
+        return response, None
+
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    if delivery_mode() != DELIVERY_DJANGO:
+        # Range и If-Range обрабатывает веб-сервер при отдаче самого файла.
+        response = _offload_response(path, filename, content_type)
+        _set_validators(response, etag, mtime)
+        return response, None
+
+    ranges = None
+    if request.method == 'GET' and _range_allowed(request, etag, mtime):
+        ranges = parse_range(request.headers.get('Range'), size)
+    if ranges == []:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        _set_validators(response, etag, mtime)
+        return response, None
+    return None, (size, content_type, ranges, (etag, mtime))
+
+
+def _compressed_plan(request, path, filename, content_hash, codec, size):
+    """Аналог ``_plan`` для сжатого на диске содержимого.
+
+    Если клиент принимает кодек и не просит диапазон, отдаются сжатые байты
+    с ``Content-Encoding``; иначе содержимое распаковывается на лету, из
+    нескольких диапазонов поддерживается только один. Такие файлы всегда
+    отдаёт Django: nginx не передаёт ``Content-Encoding`` при X-Accel-Redirect.
+
+    Возвращает ``(готовый ответ, None)`` или
+    ``(None, (encoded, content_type, range, validators))``.
+    """
+    mtime = os.stat(path).st_mtime
+    encoded = compression.accepts(request, codec) and not request.headers.get('Range')
+    # У сжатого и распакованного представлений разные ETag.
+    etag = quote_etag(f'{content_hash}-{codec}' if encoded else content_hash)
+    if _not_modified(request, etag, mtime):
+        response = HttpResponse(status=304)
+        _set_validators(response, etag, mtime)
+        response['Vary'] = 'Accept-Encoding'
+        return response, None
+
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    ranges = None
+    if not encoded and request.method == 'GET' and _range_allowed(request, etag, mtime):
+        ranges = parse_range(request.headers.get('Range'), size)
+    if ranges == []:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        _set_validators(response, etag, mtime)
+        return response, None
+    byte_range = ranges[0] if ranges and len(ranges) == 1 else None
+    return None, (encoded, content_type, byte_range, (etag, mtime))
+
+
+def _finish_compressed(response, filename, codec, encoded, byte_range, size, validators):
+    if encoded:
+        response['Content-Encoding'] = codec
+    elif byte_range:
+        start, end = byte_range
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    else:
+        response['Content-Length'] = str(size)
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    response['Vary'] = 'Accept-Encoding'
+    _set_validators(response, *validators)
+    return response
+
+
+def compressed_file_response(request, path, filename, content_hash, codec, size):
+    response, plan = _compressed_plan(request, path, filename, content_hash, codec, size)
+    if response is not None:
+        return response
+    encoded, content_type, byte_range, validators = plan
+    if encoded:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range or (0, size - 1)
+        response = StreamingHttpResponse(
+            compression.iter_decompressed(path, codec, start, end),
+            status=206 if byte_range else 200, content_type=content_type,
+        )
+    return _finish_compressed(response, filename, codec, encoded, byte_range, size, validators)
+
+
+def file_response(request, path, filename, content_hash=None, codec='', size=None):
+    """Ответ на скачивание файла ``path`` с учётом условных заголовков и Range.
+
+    Для сжатого на диске содержимого нужны ``codec`` и логический ``size``.
+    """
+    if codec:
+        return compressed_file_response(request, path, filename, content_hash, codec, size)
+    response, plan = _plan(request, path, filename, content_hash)
+    if response is not None:
+        return response
+    size, content_type, ranges, validators = plan
+
+    if ranges is None:
+        response = FileResponse(
+            open(path, 'rb'), as_attachment=True, filename=filename,
+            content_type=content_type,
+        )
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        response = FileResponse(
+            RangeFile(open(path, 'rb'), start, end), status=206,
+            as_attachment=True, filename=filename, content_type=content_type,
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    else:
+        boundary, segments, closing, length = _multipart_layout(ranges, size, content_type)
+        response = StreamingHttpResponse(
+            _multipart_ranges(open(path, 'rb'), segments, closing), status=206,
+            content_type=f'multipart/byteranges; boundary={boundary}',
+        )
+        response['Content-Length'] = str(length)
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+    _set_validators(response, *validators)
+    return response
+
+
+async def _aread_segments(path, segments, closing=b''):
+    """Асинхронно читает отрезки файла блоками в пуле потоков.
+
+    Поток занят только на время одного ``read()``; ожидание медленного
+    клиента происходит в цикле событий и поток не держит.
+    """
+    file_obj = await asyncio.to_thread(open, path, 'rb')
+    try:
+        for header, start, end in segments:
+            if header:
+                yield header
+            await asyncio.to_thread(file_obj.seek, start)
+            remaining = end - start + 1
+            while remaining > 0:
+                block = await asyncio.to_thread(
+                    file_obj.read, min(ASYNC_READ_BLOCK_SIZE, remaining)
+                )
+                if not block:
+                    break
+                remaining -= len(block)
+                yield block
+            if header:
+                yield b'\r\n'
+        if closing:
+            yield closing
+    finally:
+        await asyncio.to_thread(file_obj.close)
+
+
+async def _aiter_in_thread(iterator):
+    """Отдаёт элементы синхронного итератора, вычисляя каждый в пуле потоков."""
+    sentinel = object()
+    while True:
+        item = await asyncio.to_thread(next, iterator, sentinel)
+        if item is sentinel:
+            break
+        yield item
+
+
+async def acompressed_file_response(request, path, filename, content_hash, codec, size):
+    response, plan = await asyncio.to_thread(
+        _compressed_plan, request, path, filename, content_hash, codec, size
+    )
+    if response is not None:
+        return response
+    encoded, content_type, byte_range, validators = plan
+    if encoded:
+        stored_size = await asyncio.to_thread(os.path.getsize, path)
+        body = _aread_segments(path, [(b'', 0, stored_size - 1)])
+        response = StreamingHttpResponse(body, content_type=content_type)
+        response['Content-Length'] = str(stored_size)
+    else:
+        start, end = byte_range or (0, size - 1)
+        body = _aiter_in_thread(compression.iter_decompressed(path, codec, start, end))
+        response = StreamingHttpResponse(
+            body, status=206 if byte_range else 200, content_type=content_type,
+        )
+    return _finish_compressed(response, filename, codec, encoded, byte_range, size, validators)
+
+
+async def afile_response(request, path, filename, content_hash=None, codec='', size=None):
+    """Асинхронный вариант ``file_response`` для ASGI с неблокирующим чтением."""
+    if codec:
+        return await acompressed_file_response(
+            request, path, filename, content_hash, codec, size
+        )
+    response, plan = await asyncio.to_thread(_plan, request, path, filename, content_hash)
+    if response is not None:
+        return response
+    size, content_type, ranges, validators = plan
+
+    if ranges is None or len(ranges) == 1:
+        start, end = ranges[0] if ranges else (0, size - 1)
+        response = StreamingHttpResponse(
+            _aread_segments(path, [(b'', start, end)]),
+            status=206 if ranges else 200,
+            content_type=content_type,
+        )
+        response['Content-Length'] = str(end - start + 1)
+        if ranges:
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    else:
+        boundary, segments, closing, length = _multipart_layout(ranges, size, content_type)
+        response = StreamingHttpResponse(
+            _aread_segments(path, segments, closing), status=206,
+            content_type=f'multipart/byteranges; boundary={boundary}',
+        )
+        response['Content-Length'] = str(length)
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    _set_validators(response, *validators)
+    return response
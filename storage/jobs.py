@@ -0,0 +1,125 @@
+"""Фоновые задачи с очередью в базе данных, без внешнего брокера.
+
+Задача ставится в очередь через ``enqueue`` и выполняется командой
+``python manage.py run_jobs``. Воркер забирает задачи через
+``SELECT ... FOR UPDATE SKIP LOCKED``, поэтому несколько воркеров не
+возьмут одну задачу. Задача, воркер которой перестал обновлять
+``heartbeat_at`` дольше ``JOB_LOCK_TIMEOUT``, считается упавшей и
+забирается повторно, поэтому обработчики должны быть идемпотентными.
+
+Обработчики регистрируются декоратором ``handler`` (см. ``storage.tasks``).
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+LOCK_TIMEOUT = timedelta(minutes=10)
+RETRY_BASE_DELAY = 10
+RETRY_MAX_DELAY = 3600
+
+
+def handler(kind):
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, payload=None, created_by=None, max_attempts=None):
+    if kind not in HANDLERS:
+        raise ValueError(f'Неизвестный тип задачи: {kind}')
+    job = Job(
+        kind=kind,
+        payload=payload or {},
+        created_by=created_by,
+        run_after=timezone.now(),
+    )
+    if max_attempts is not None:
+        job.max_attempts = max_attempts
+    job.save()
+    return job
+
+
+class JobContext:
+    """Передаётся обработчику для отчёта о прогрессе и продления блокировки."""
+
+    def __init__(self, job):
+        self.job = job
+
+    def progress(self, done, total=None):
+        fields = {'progress_done': done, 'heartbeat_at': timezone.now()}
+        if total is not None:
+            fields['progress_total'] = total
+        Job.objects.filter(pk=self.job.pk).update(**fields)
+        for name, value in fields.items():
+            setattr(self.job, name, value)
+
+
+def _lock_timeout():
+    return getattr(settings, 'JOB_LOCK_TIMEOUT', LOCK_TIMEOUT)
+
+
+def claim(worker_id):
+    """Забирает следующую готовую к выполнению задачу или ``None``."""
+    now = timezone.now()
+    with transaction.atomic():
+        job = (
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=Job.STATUS_QUEUED, run_after__lte=now)
+                | Q(status=Job.STATUS_RUNNING, heartbeat_at__lt=now - _lock_timeout())
+            )
+            .order_by('run_after', 'id')
+            .first()
+        )
+        if job is None:
+            return None
+        if job.status == Job.STATUS_RUNNING:
+            logger.warning(f"Задача {job.id} брошена воркером {job.locked_by}, перезапуск")
+        job.status = Job.STATUS_RUNNING
+        job.locked_by = worker_id
+        job.heartbeat_at = now
+        job.attempts += 1
+        job.save(update_fields=['status', 'locked_by', 'heartbeat_at', 'attempts'])
+    return job
+
+
+def execute(job):
+    func = HANDLERS.get(job.kind)
+    try:
+        if func is None:
+            raise LookupError(f'Нет обработчика для задачи {job.kind}')
+        func(JobContext(job), **job.payload)
+    except Exception as e:
+        logger.exception(f"Задача {job.id} ({job.kind}) завершилась ошибкой")
+        job.error = f'{type(e).__name__}: {e}'
+        if func is not None and job.attempts < job.max_attempts:
+            delay = min(RETRY_BASE_DELAY * 2 ** (job.attempts - 1), RETRY_MAX_DELAY)
+            job.status = Job.STATUS_QUEUED
+            job.run_after = timezone.now() + timedelta(seconds=delay)
+        else:
+            job.status = Job.STATUS_FAILED
+            job.finished_at = timezone.now()
+    else:
+        job.status = Job.STATUS_DONE
+        job.error = ''
+        job.finished_at = timezone.now()
+    job.locked_by = ''
+    job.save(update_fields=['status', 'error', 'run_after', 'finished_at', 'locked_by'])
+    return job
+
+
+def run_next(worker_id):
+    job = claim(worker_id)
+    if job is None:
+        return None
+    return execute(job)
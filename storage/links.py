@@ -0,0 +1,76 @@
+"""Разрешение публичных ссылок ``special_link`` с кэшем в памяти процесса.
+
+Скачивание по ссылке — самый частый запрос, а для пути к файлу нужны и
+``UserFile``, и ``storage_path`` владельца. Результат кэшируется в
+``TTLCache``. Переименование, удаление и перенос файла сбрасывают запись
+явно, но только в своём процессе. Поэтому запись из кэша перед отдачей
+сверяется с ``UserFile`` по первичному ключу: содержимое blob'а остаётся на
+диске, пока на него ссылаются другие файлы, и без проверки другой воркер
+отдавал бы удалённый файл под старым именем.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+
+from . import blobs
+from .caching import TTLCache
+from .models import UserFile
+
+CACHE_SIZE = 10000
+CACHE_TTL = 30
+
+ResolvedLink = namedtuple('ResolvedLink', 'file_id path original_name size validator codec user_id')
+
+cache = TTLCache(
+    lambda: getattr(settings, 'SPECIAL_LINK_CACHE_SIZE', CACHE_SIZE),
+    lambda: getattr(settings, 'SPECIAL_LINK_CACHE_TTL', CACHE_TTL),
+)
+
+
+def resolve(special_link):
+    """``ResolvedLink`` для ссылки или ``None``, если файла нет.
+
+    ``validator`` — SHA-256 содержимого для файлов из хранилища blob'ов,
+    для старых файлов ``None`` (ETag строится по размеру и mtime);
+    ``codec`` — кодек сжатия на диске (см. ``storage.compression``).
+    """
+    key = str(special_link)
+    resolved = cache.get(key)
+    if resolved is not None:
+        if _current(resolved):
+            return resolved
+        cache.discard(key)
+    user_file = (
+        UserFile.objects.select_related('user', 'blob')
+        .only('id', 'original_name', 'stored_name', 'size', 'user__storage_path', 'blob__codec')
+        .filter(special_link=special_link)
+        .first()
+    )
+    if user_file is None:
+        return None
+    resolved = ResolvedLink(
+        user_file.id,
+        blobs.user_file_path(user_file),
+        user_file.original_name,
+        user_file.size,
+        user_file.blob_id,
+        user_file.blob.codec if user_file.blob_id else '',
+        user_file.user_id,
+    )
+    cache.set(key, resolved)
+    return resolved
+
+
+def _current(resolved):
+    """Файл из записи кэша не удалён, не переименован и не перенесён."""
+    return UserFile.objects.filter(
+        pk=resolved.file_id,
+        user_id=resolved.user_id,
+        original_name=resolved.original_name,
+        blob_id=resolved.validator,
+    ).exists()
+
+
+def invalidate(*special_links):
+    for special_link in special_links:
+        cache.discard(str(special_link))
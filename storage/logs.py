@@ -0,0 +1,245 @@
+"""Структурные логи: JSON-строки, которые пишет отдельный поток.
+
+``AsyncHandler`` в потоке, вызвавшем логгер, только подставляет аргументы в
+сообщение и кладёт запись в ограниченную очередь; форматирование в JSON и
+запись в поток вывода выполняет фоновый поток. Если вывод не успевает и
+очередь заполнена, запись отбрасывается и учитывается в ``stats()`` —
+запросы не ждут stdout.
+
+``SamplingFilter`` работает до очереди: записи ниже WARNING сохраняются с
+долей ``LOG_SAMPLING`` по логгерам, а ``LOG_RATE_LIMITS`` ограничивает число
+записей в секунду для логгера любого уровня. Число подавленных ограничением
+записей попадает в поле ``suppressed`` следующей пропущенной записи.
+
+``JsonFormatter`` скрывает значения чувствительных полей (пароли, токены,
+cookie) в ``extra`` и в тексте сообщения вида ``'password': '...'``.
+
+Отключённые уровни отсекаются самим ``logging`` по уровню логгера, поэтому
+в горячих местах для отладочных логов используются ``%``-аргументы, а не
+f-строки: при выключенном DEBUG сообщение не собирается.
+"""
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+QUEUE_SIZE = 10000
+REDACTED = '***'
+SENSITIVE_KEYS = ('password', 'passwd', 'secret', 'token', 'authorization', 'cookie',
+                  'sessionid', 'csrf', 'api_key')
+
+_sensitive = '|'.join(SENSITIVE_KEYS)
+_SENSITIVE_KEY_RE = re.compile(_sensitive, re.IGNORECASE)
+# Ключ с чувствительным словом, ':' или '=', затем значение в кавычках или до
+# разделителя; у Authorization пропускается схема (Token, Bearer, Basic).
+_SENSITIVE_VALUE_RE = re.compile(
+    rf"""(["']?[\w-]*(?:{_sensitive})[\w-]*["']?\s*[:=]\s*(?:(?:Token|Bearer|Basic)\s+)?)"""
+    r"""("[^"]*"|'[^']*'|[^\s,;&}\]]+)""",
+    re.IGNORECASE,
+)
+_RECORD_FIELDS = set(logging.LogRecord('', 0, '', 0, '', (), None).__dict__) | {
+    'message', 'asctime', 'suppressed',
+}
+_MAX_DEPTH = 5
+
+_lock = threading.Lock()
+_stats = {'dropped': 0, 'sampled_out': 0, 'rate_limited': 0}
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+
+
+def stats():
+    """Отброшенные записи в этом процессе по причинам."""
+    with _lock:
+        return dict(_stats)
+
+
+def redact(value, depth=0):
+    """Копия ``value`` со скрытыми значениями чувствительных ключей."""
+    if depth > _MAX_DEPTH:
+        return value
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if isinstance(key, str) and _SENSITIVE_KEY_RE.search(key)
+            else redact(item, depth + 1)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [redact(item, depth + 1) for item in value]
+    if isinstance(value, str):
+        return redact_text(value)
+    return value
+
+
+def redact_text(text):
+    if not _SENSITIVE_KEY_RE.search(text):
+        return text
+    return _SENSITIVE_VALUE_RE.sub(rf'\1{REDACTED}', text)
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись: время, уровень, логгер, сообщение, ``extra``."""
+
+    def format(self, record):
+        data = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': redact_text(record.getMessage()),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS and not key.startswith('_'):
+                data[key] = REDACTED if _SENSITIVE_KEY_RE.search(key) else redact(value)
+        if getattr(record, 'suppressed', 0):
+            data['suppressed'] = record.suppressed
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exc'] = redact_text(record.exc_text)
+        if record.stack_info:
+            data['stack'] = record.stack_info
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class AsyncHandler(logging.Handler):
+    """Пишет записи в ``stream`` из фонового потока через очередь."""
+
+    def __init__(self, stream=None, queue_size=QUEUE_SIZE):
+        super().__init__()
+        self.stream = stream
+        self.queue_size = queue_size
+        self._queue = None
+        self._thread = None
+        self._pid = None
+
+    def _start(self):
+        # После fork (gunicorn --preload) поток родителя не существует,
+        # а блокировки очереди могли остаться захваченными.
+        self._queue = queue.Queue(self.queue_size)
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+        self._thread.start()
+
+    def emit(self, record):
+        if self._pid != os.getpid():
+            with _lock:
+                if self._pid != os.getpid():
+                    self._start()
+        try:
+            self._queue.put_nowait(self._prepare(record))
+        except queue.Full:
+            _count('dropped')
+        except Exception:
+            self.handleError(record)
+
+    def _prepare(self, record):
+        # Аргументы подставляются сразу: они могут измениться до записи.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # Трассировка форматируется здесь, чтобы очередь не держала кадры стека.
+            formatter = self.formatter or logging.Formatter()
+            record.exc_text = formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def _run(self):
+        stream = self.stream or sys.stdout
+        records = self._queue
+        while True:
+            record = records.get()
+            if record is None:
+                break
+            try:
+                stream.write(self.format(record) + '\n')
+                # Сбрасываем буфер, только когда очередь опустела.
+                if records.empty():
+                    stream.flush()
+            except Exception:
+                self.handleError(record)
+        stream.flush()
+
+    def close(self):
+        if self._pid == os.getpid() and self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=1)
+            except queue.Full:
+                pass
+            self._thread.join(timeout=5)
+        super().close()
+
+
+class SamplingFilter(logging.Filter):
+    """Выборка и ограничение частоты записей по логгерам.
+
+    Настройки ищутся по имени логгера и его родителям: ``'storage'``
+    действует и на ``storage.views``.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.sampling = getattr(settings, 'LOG_SAMPLING', {})
+        self.rate_limits = getattr(settings, 'LOG_RATE_LIMITS', {})
+        self._resolved = {}
+        # логгер из настроек -> [токены, время пополнения, подавлено]
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _resolve(self, name):
+        resolved = self._resolved.get(name)
+        if resolved is None:
+            resolved = self._resolved[name] = (
+                _closest(name, self.sampling), _closest(name, self.rate_limits),
+            )
+        return resolved
+
+    def filter(self, record):
+        sampled, limited = self._resolve(record.name)
+        if sampled is not None and record.levelno < logging.WARNING:
+            if random.random() >= self.sampling[sampled]:
+                _count('sampled_out')
+                return False
+        if limited is not None:
+            return self._take(limited, record)
+        return True
+
+    def _take(self, name, record):
+        rate = self.rate_limits[name]
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(name)
+            if bucket is None:
+                bucket = self._buckets[name] = [rate, now, 0]
+            # Запас — не больше записей за одну секунду.
+            bucket[0] = min(rate, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                allowed = False
+            else:
+                bucket[0] -= 1
+                record.suppressed, bucket[2] = bucket[2], 0
+                allowed = True
+        if not allowed:
+            _count('rate_limited')
+        return allowed
+
+
+def _closest(name, config):
+    """Имя ближайшего к ``name`` логгера из ``config`` (сам логгер или предок)."""
+    while name:
+        if name in config:
+            return name
+        name = name.rpartition('.')[0]
+    return '' if '' in config else None
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from storage.uploads import cleanup_expired_sessions
+
+
+class Command(BaseCommand):
+    help = 'Удаляет просроченные сессии загрузки частями и их временные файлы'
+
+    def handle(self, *args, **options):
+        removed = cleanup_expired_sessions()
+        self.stdout.write(self.style.SUCCESS(f'Удалено сессий: {removed}'))
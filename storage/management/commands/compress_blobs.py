@@ -0,0 +1,76 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from storage import blobs, compression
+from storage.models import Blob
+
+
+class Command(BaseCommand):
+    help = (
+        'Сжимает уже сохранённые blob\'ы, которые хорошо сжимаются. '
+        'Работает в фоне рядом с приложением, можно прерывать и запускать повторно.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--limit', type=int, default=0, help='Сколько blob\'ов обработать (0 — все)')
+        parser.add_argument(
+            '--sleep', type=float, default=0,
+            help='Пауза между файлами в секундах, чтобы не нагружать диск',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        limit = options['limit']
+        checked = compressed = saved = 0
+        last_sha = ''
+        while not limit or checked < limit:
+            batch = list(
+                Blob.objects.filter(codec='', ref_count__gt=0, sha256__gt=last_sha)
+                .order_by('sha256')
+                .values_list('sha256', 'size')[:batch_size]
+            )
+            if not batch:
+                break
+            for sha256, size in batch:
+                last_sha = sha256
+                checked += 1
+                stored_size = self._compress(sha256, size)
+                if stored_size is not None:
+                    compressed += 1
+                    saved += size - stored_size
+                if options['sleep']:
+                    time.sleep(options['sleep'])
+                if limit and checked >= limit:
+                    break
+            self.stdout.write(f'Проверено: {checked}, сжато: {compressed}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено: {checked}, сжато: {compressed}, освобождено байт: {saved}'
+        ))
+
+    def _compress(self, sha256, size):
+        path = blobs.blob_path(sha256)
+        if not os.path.exists(path) or not compression.is_compressible(path):
+            return None
+        tmp_path = blobs.temp_path()
+        try:
+            stored_size = compression.compress_file(path, tmp_path)
+            if not compression.worthwhile(stored_size, size):
+                return None
+            with transaction.atomic():
+                blob = Blob.objects.select_for_update().filter(sha256=sha256).first()
+                if blob is None or blob.codec or not os.path.exists(path):
+                    return None
+                os.replace(tmp_path, blobs.blob_path(sha256, compression.CODEC_GZIP))
+                blob.codec, blob.stored_size = compression.CODEC_GZIP, stored_size
+                blob.save(update_fields=['codec', 'stored_size'])
+                # Несжатая копия нужна до фиксации: её ещё могут читать.
+                transaction.on_commit(lambda: os.remove(path))
+            return stored_size
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
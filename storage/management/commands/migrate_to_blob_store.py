@@ -0,0 +1,47 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from storage import blobs
+from storage.models import UserFile
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит файлы из каталогов пользователей в хранилище blob\'ов '
+        'с дедупликацией по SHA-256. Можно прерывать и запускать повторно.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--purge', action='store_true',
+            help='Удалить blob\'ы, на которые не осталось ссылок',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        converted = missing = 0
+        last_id = 0
+        while True:
+            batch = list(
+                UserFile.objects.filter(blob__isnull=True, id__gt=last_id)
+                .select_related('user')
+                .order_by('id')[:batch_size]
+            )
+            if not batch:
+                break
+            for user_file in batch:
+                last_id = user_file.id
+                if not os.path.exists(blobs.legacy_file_path(user_file)):
+                    missing += 1
+                    self.stderr.write(f'Нет файла на диске: id={user_file.id}')
+                    continue
+                if blobs.convert_legacy(user_file):
+                    converted += 1
+            self.stdout.write(f'Обработано до id={last_id}, перенесено: {converted}')
+
+        purged = blobs.purge_unreferenced() if options['purge'] else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено: {converted}, без файла: {missing}, удалено blob\'ов: {purged}'
+        ))
@@ -0,0 +1,71 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from storage import blobs
+from storage.models import UserFile
+
+
+class Command(BaseCommand):
+    help = (
+        'Раскладывает файлы в каталогах пользователей по подкаталогам согласно '
+        'STORAGE_FANOUT_LEVELS. Работает рядом с приложением: пока файл не '
+        'перенесён, он читается по старому пути. Можно прерывать и запускать повторно.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--after-id', type=int, default=0, help='Продолжить после этого id файла')
+        parser.add_argument(
+            '--sleep', type=float, default=0,
+            help='Пауза между пакетами в секундах, чтобы не нагружать диск',
+        )
+
+    def handle(self, *args, **options):
+        levels = blobs.fanout_levels()
+        moved = missing = 0
+        last_id = options['after_id']
+        while True:
+            batch = list(
+                UserFile.objects.filter(blob__isnull=True, id__gt=last_id)
+                .order_by('id')
+                .values_list('id', flat=True)[:options['batch_size']]
+            )
+            if not batch:
+                break
+            for file_id in batch:
+                last_id = file_id
+                result = self._move(file_id, levels)
+                if result is None:
+                    missing += 1
+                    self.stderr.write(f'Нет файла на диске: id={file_id}')
+                elif result:
+                    moved += 1
+            self.stdout.write(f'Обработано до id={last_id}, перенесено: {moved}')
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f'Перенесено: {moved}, без файла: {missing}'))
+
+    def _move(self, file_id, levels):
+        """``True`` — перенесён, ``False`` — уже на месте, ``None`` — файла нет."""
+        with transaction.atomic():
+            # Блокировка строки не даёт пакетным операциям перенести файл
+            # к другому пользователю, пока он перекладывается.
+            user_file = (
+                UserFile.objects.select_for_update(of=('self',)).select_related('user')
+                .filter(pk=file_id, blob__isnull=True).first()
+            )
+            if user_file is None:
+                return False
+            target = blobs.legacy_file_path(user_file, levels=levels)
+            if os.path.exists(target):
+                return False
+            source = blobs.legacy_file_path(user_file)
+            if not os.path.exists(source):
+                return None
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(source, target)
+            return True
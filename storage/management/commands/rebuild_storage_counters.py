@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from storage.models import User, UserFile
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает User.file_count и User.total_bytes по таблице файлов. '
+        'Пользователи блокируются пачками, чтобы не пропустить параллельные загрузки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        fixed = checked = 0
+        last_id = 0
+        while True:
+            with transaction.atomic():
+                users = list(
+                    User.objects.select_for_update()
+                    .filter(id__gt=last_id)
+                    .order_by('id')
+                    .only('id', 'file_count', 'total_bytes')[:batch_size]
+                )
+                if not users:
+                    break
+                totals = {
+                    row['user_id']: (row['files'], row['size'] or 0)
+                    for row in UserFile.objects.filter(user__in=users)
+                    .values('user_id')
+                    .annotate(files=Count('id'), size=Sum('size'))
+                }
+                stale = []
+                for user in users:
+                    files, size = totals.get(user.id, (0, 0))
+                    if (user.file_count, user.total_bytes) != (files, size):
+                        user.file_count, user.total_bytes = files, size
+                        stale.append(user)
+                if stale:
+                    User.objects.bulk_update(stale, ['file_count', 'total_bytes'])
+            checked += len(users)
+            fixed += len(stale)
+            last_id = users[-1].id
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено пользователей: {checked}, исправлено: {fixed}'
+        ))
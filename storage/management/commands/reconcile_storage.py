@@ -0,0 +1,107 @@
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from storage import reconcile
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет файлы на диске с записями в БД: лишние файлы, записи без файлов, '
+        'забытые временные файлы. По умолчанию только сообщает; с --repair лишние '
+        'файлы переносятся в MEDIA_ROOT/.orphans, а записи без файлов удаляются. '
+        'Прерванную сверку можно продолжить с тем же --state.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true', help='Исправить найденное')
+        parser.add_argument('--workers', type=int, default=4, help='Потоков для обхода каталогов')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Строк БД за один запрос')
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help='Файлы моложе стольких секунд не считаются лишними',
+        )
+        parser.add_argument(
+            '--rate', type=float, default=0,
+            help='Не больше стольких файлов и строк БД в секунду (0 — без ограничения)',
+        )
+        parser.add_argument('--state', help='Файл с позицией для продолжения прерванной сверки')
+
+    def handle(self, *args, **options):
+        state = self._load_state(options['state'])
+        totals = state['totals']
+        window = max(1, options['workers']) * 2
+        started = time.monotonic()
+        checked = 0
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            # Каталоги обходятся на несколько единиц вперёд, сверка с БД идёт
+            # по порядку, поэтому позицию для продолжения можно сохранять.
+            pending = deque()
+            units = reconcile.units(state['shard'], state['user_id'])
+            while True:
+                for unit in units:
+                    pending.append((unit, pool.submit(reconcile.scan_tree, unit.root)))
+                    if len(pending) >= window:
+                        break
+                if not pending:
+                    break
+                unit, future = pending.popleft()
+                checked += self._process(unit, future.result(), options, totals)
+                if unit.kind == 'blobs':
+                    state['shard'] = unit.key
+                elif unit.kind == 'user':
+                    state['user_id'] = unit.key
+                self._save_state(options['state'], state)
+                if options['rate']:
+                    # Спим, пока средняя скорость не опустится до --rate.
+                    delay = checked / options['rate'] - (time.monotonic() - started)
+                    if delay > 0:
+                        time.sleep(delay)
+
+        if options['state'] and os.path.exists(options['state']):
+            os.remove(options['state'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Файлов: {totals['files']}, строк БД: {totals['rows']}, "
+            f"расхождений: {totals['found']}, исправлено: {totals['repaired']}"
+        ))
+
+    def _process(self, unit, files, options, totals):
+        file_count = len(files)
+        findings, rows = reconcile.diff(unit, files, options['batch_size'], options['min_age'])
+        totals['files'] += file_count
+        totals['rows'] += rows
+        for finding in findings:
+            if not reconcile.confirm(unit, finding, options['min_age']):
+                continue
+            totals['found'] += 1
+            action = ''
+            if options['repair']:
+                try:
+                    action = reconcile.repair(unit, finding)
+                    totals['repaired'] += 1
+                except OSError as e:
+                    action = f'ошибка: {str(e)}'
+            ref = '' if finding.ref is None else finding.ref
+            self.stdout.write('\t'.join(str(part) for part in (finding.kind, finding.path, ref, action)))
+        return file_count + rows
+
+    def _load_state(self, path):
+        state = {'shard': None, 'user_id': 0,
+                 'totals': {'files': 0, 'rows': 0, 'found': 0, 'repaired': 0}}
+        if path and os.path.exists(path):
+            with open(path) as source:
+                state.update(json.load(source))
+            self.stdout.write(f"Продолжение: шард {state['shard']}, пользователь id>{state['user_id']}")
+        return state
+
+    def _save_state(self, path, state):
+        if not path:
+            return
+        with open(f'{path}.tmp', 'w') as output:
+            json.dump(state, output)
+        os.replace(f'{path}.tmp', path)
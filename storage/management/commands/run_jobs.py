@@ -0,0 +1,43 @@
+import os
+import signal
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from storage import jobs
+
+
+class Command(BaseCommand):
+    help = 'Воркер фоновых задач из очереди в базе данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить все готовые задачи и завершиться',
+        )
+        parser.add_argument('--poll-interval', type=float, default=2.0)
+        parser.add_argument('--worker-id', default=f'{socket.gethostname()}:{os.getpid()}')
+
+    def handle(self, *args, **options):
+        self._stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        worker_id = options['worker_id']
+        self.stdout.write(f'Воркер {worker_id} запущен')
+
+        while not self._stopping:
+            close_old_connections()
+            job = jobs.run_next(worker_id)
+            if job is not None:
+                self.stdout.write(f'Задача {job.id} ({job.kind}): {job.status}')
+                continue
+            if options['once']:
+                break
+            time.sleep(options['poll_interval'])
+        self.stdout.write(f'Воркер {worker_id} остановлен')
+
+    def _stop(self, signum, frame):
+        # Текущая задача дорабатывает, новые не берутся.
+        self._stopping = True
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from storage import scrub
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверяет целостность blob\'ов: заново хеширует файлы, которые дольше всех '
+        'не проверялись, и записывает расхождения в ScrubFinding. Можно прерывать: '
+        'следующий запуск продолжит с непроверенных.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='Процессов для хеширования')
+        parser.add_argument(
+            '--bandwidth', type=float, default=0,
+            help='Суммарная скорость чтения, МБ/с (0 — без ограничения)',
+        )
+        parser.add_argument('--max-seconds', type=int, default=0, help='Ограничение времени запуска')
+        parser.add_argument('--max-gb', type=float, default=0, help='Сколько ГБ прочитать за запуск')
+
+    def handle(self, *args, **options):
+        run = scrub.scrub(
+            workers=options['workers'],
+            bandwidth=int(options['bandwidth'] * 1024 * 1024),
+            max_seconds=options['max_seconds'] or None,
+            max_bytes=int(options['max_gb'] * 1024 ** 3) or None,
+        )
+        elapsed = (run.finished_at - run.started_at).total_seconds()
+        speed = run.bytes_checked / elapsed / 1024 / 1024 if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено: {run.blobs_checked} ({run.bytes_checked} байт, {speed:.1f} МБ/с), '
+            f'расхождений: {run.findings}'
+        ))
@@ -0,0 +1,307 @@
+"""Метрики производительности по эндпоинтам в формате Prometheus.
+
+``MetricsMiddleware`` (см. ``storage.middleware``) для каждого запроса
+записывает с меткой ``view`` (имя URL или путь к представлению):
+
+* гистограмму задержки до ответа представления;
+* число и суммарное время запросов к БД;
+* принятые и отправленные байты;
+* число выполняемых запросов и незавершённых потоковых передач.
+
+Запросы к БД считает обёртка ``execute_wrapper``, которая ставится на каждое
+подключение и пишет в счётчики текущего запроса через ``ContextVar`` (видна
+и в потоках ``sync_to_async``). Вне запроса обёртка стоит одного вызова.
+По алиасам БД (``alias``) считаются запросы и их время, открытые
+подключения и выбор БД для эндпоинтов только для чтения (см.
+``storage.replicas``).
+
+Каждый процесс хранит метрики у себя. При нескольких воркерах gunicorn
+нужен ``METRICS_DIR``: процессы периодически сбрасывают туда снимки, а
+эндпоинт метрик суммирует снимки всех живых процессов.
+
+Медленные запросы (``METRICS_SLOW_REQUEST_SECONDS``) с вероятностью
+``METRICS_TRACE_SAMPLE_RATE`` пишутся в лог вместе с выполненным SQL.
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+from . import logs
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DUMP_INTERVAL = 5.0
+SLOW_REQUEST_SECONDS = 1.0
+MAX_TRACE_QUERIES = 200
+
+# имя -> (метрика, описание, метка)
+COUNTERS = {
+    'db_queries': ('mycloud_db_queries_total', 'Запросы к БД', 'view'),
+    'db_seconds': ('mycloud_db_query_seconds_total', 'Время запросов к БД, с', 'view'),
+    'bytes_in': ('mycloud_http_request_bytes_total', 'Принято байт в телах запросов', 'view'),
+    'bytes_out': ('mycloud_http_response_bytes_total', 'Отправлено байт в телах ответов', 'view'),
+    'db_alias_queries': ('mycloud_db_alias_queries_total', 'Запросы к БД по подключениям', 'alias'),
+    'db_alias_seconds': ('mycloud_db_alias_query_seconds_total', 'Время запросов к БД по подключениям, с', 'alias'),
+    'db_connections': ('mycloud_db_connections_opened_total', 'Открытые подключения к БД', 'alias'),
+    'db_routed_reads': (
+        'mycloud_db_routed_reads_total', 'Запросы только для чтения по выбранной БД', 'alias',
+    ),
+}
+GAUGES = {
+    'in_flight': (
+        'mycloud_transfers_in_flight', 'Выполняемые запросы и незавершённые потоковые ответы', 'view',
+    ),
+}
+
+
+class RequestStats:
+    __slots__ = ('queries', 'query_time', 'aliases', 'sql')
+
+    def __init__(self, trace=False):
+        self.queries = 0
+        self.query_time = 0.0
+        # алиас БД -> [запросов, время]
+        self.aliases = {}
+        self.sql = [] if trace else None
+
+
+current = contextvars.ContextVar('metrics_request_stats', default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        stats.queries += 1
+        stats.query_time += elapsed
+        alias = stats.aliases.get(context['connection'].alias)
+        if alias is None:
+            alias = stats.aliases[context['connection'].alias] = [0, 0.0]
+        alias[0] += 1
+        alias[1] += elapsed
+        if stats.sql is not None and len(stats.sql) < MAX_TRACE_QUERIES:
+            stats.sql.append((elapsed, sql))
+
+
+def install_query_hook(sender, connection, **kwargs):
+    # В начало списка: execute_wrapper() снимает свою обёртку через pop().
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record_query)
+    registry.add('db_connections', connection.alias)
+
+
+connection_created.connect(install_query_hook)
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._last_dump = 0.0
+
+    def observe(self, view, method, status, duration, stats, bytes_in):
+        with self._lock:
+            key = (view, method, status)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(LATENCY_BUCKETS) + 2)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if duration <= bound:
+                    histogram[i] += 1
+                    break
+            else:
+                histogram[len(LATENCY_BUCKETS)] += 1
+            histogram[-1] += duration
+            self._add('db_queries', view, stats.queries)
+            self._add('db_seconds', view, stats.query_time)
+            self._add('bytes_in', view, bytes_in)
+            for alias, (queries, query_time) in stats.aliases.items():
+                self._add('db_alias_queries', alias, queries)
+                self._add('db_alias_seconds', alias, query_time)
+
+    def add(self, name, label, value=1):
+        with self._lock:
+            self._add(name, label, value)
+
+    def add_bytes_out(self, view, size):
+        with self._lock:
+            self._add('bytes_out', view, size)
+
+    def in_flight(self, view, delta):
+        with self._lock:
+            key = ('in_flight', view)
+            self._gauges[key] = self._gauges.get(key, 0) + delta
+
+    def _add(self, name, label, value):
+        if value:
+            key = (name, label)
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'histograms': [[list(key), list(value)] for key, value in self._histograms.items()],
+                'counters': [[list(key), value] for key, value in self._counters.items()],
+                'gauges': [[list(key), value] for key, value in self._gauges.items()],
+            }
+
+    def maybe_dump(self):
+        """Сбрасывает снимок в ``METRICS_DIR`` не чаще раза в ``DUMP_INTERVAL``."""
+        directory = getattr(settings, 'METRICS_DIR', None)
+        now = time.monotonic()
+        if not directory or now - self._last_dump < DUMP_INTERVAL:
+            return
+        self._last_dump = now
+        dump_snapshot(directory, self.snapshot())
+
+
+registry = Registry()
+
+
+def dump_snapshot(directory, snapshot):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{os.getpid()}.json')
+    tmp_path = f'{path}.tmp'
+    try:
+        with open(tmp_path, 'w') as output:
+            json.dump(snapshot, output)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.error(f"Не удалось записать снимок метрик {path}: {str(e)}")
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def collect():
+    """Снимки всех процессов: свой — из памяти, остальные — из ``METRICS_DIR``."""
+    snapshots = [registry.snapshot()]
+    directory = getattr(settings, 'METRICS_DIR', None)
+    if not directory or not os.path.isdir(directory):
+        return snapshots
+    for entry in os.scandir(directory):
+        name, ext = os.path.splitext(entry.name)
+        if ext != '.json' or not name.isdigit() or int(name) == os.getpid():
+            continue
+        if not _pid_alive(int(name)):
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+            continue
+        try:
+            with open(entry.path) as source:
+                snapshots.append(json.load(source))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def _merge(snapshots):
+    histograms, counters, gauges = {}, {}, {}
+    for snapshot in snapshots:
+        for key, values in snapshot['histograms']:
+            current_values = histograms.setdefault(tuple(key), [0] * len(values))
+            for i, value in enumerate(values):
+                current_values[i] += value
+        for target, items in ((counters, snapshot['counters']), (gauges, snapshot['gauges'])):
+            for key, value in items:
+                target[tuple(key)] = target.get(tuple(key), 0) + value
+    return histograms, counters, gauges
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _cache_stats():
+    from . import authentication, links
+    return {'auth_tokens': authentication.local_cache.stats(), 'special_links': links.cache.stats()}
+
+
+def _replica_health():
+    from . import replicas
+    return replicas.health()
+
+
+def render():
+    """Текст метрик в формате Prometheus по всем процессам."""
+    histograms, counters, gauges = _merge(collect())
+    lines = [
+        '# HELP mycloud_http_request_duration_seconds Время до ответа представления, с',
+        '# TYPE mycloud_http_request_duration_seconds histogram',
+    ]
+    for (view, method, status), values in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip((*LATENCY_BUCKETS, '+Inf'), values):
+            cumulative += count
+            labels = _labels(view=view, method=method, status=status, le=bound)
+            lines.append(f'mycloud_http_request_duration_seconds_bucket{labels} {cumulative}')
+        labels = _labels(view=view, method=method, status=status)
+        lines.append(f'mycloud_http_request_duration_seconds_sum{labels} {values[-1]}')
+        lines.append(f'mycloud_http_request_duration_seconds_count{labels} {cumulative}')
+    for kind, target, metrics in (('counter', counters, COUNTERS), ('gauge', gauges, GAUGES)):
+        for name, (metric, description, label) in metrics.items():
+            lines.append(f'# HELP {metric} {description}')
+            lines.append(f'# TYPE {metric} {kind}')
+            for (key_name, value_label), value in sorted(target.items()):
+                if key_name == name:
+                    lines.append(f'{metric}{_labels(**{label: value_label})} {value}')
+    # Кэши процесса, который обслуживает этот запрос.
+    lines.append('# HELP mycloud_cache_requests_total Обращения к кэшам в памяти процесса')
+    lines.append('# TYPE mycloud_cache_requests_total counter')
+    for cache_name, stats in _cache_stats().items():
+        for result in ('hits', 'misses'):
+            labels = _labels(cache=cache_name, result=result)
+            lines.append(f'mycloud_cache_requests_total{labels} {stats[result]}')
+    lines.append('# HELP mycloud_log_records_dropped_total Отброшенные записи лога в этом процессе')
+    lines.append('# TYPE mycloud_log_records_dropped_total counter')
+    for reason, count in logs.stats().items():
+        lines.append(f'mycloud_log_records_dropped_total{_labels(reason=reason)} {count}')
+    lines.append('# HELP mycloud_db_replica_up Прошла ли реплика последнюю проверку в этом процессе')
+    lines.append('# TYPE mycloud_db_replica_up gauge')
+    for alias, healthy in _replica_health().items():
+        lines.append(f'mycloud_db_replica_up{_labels(alias=alias)} {int(healthy)}')
+    return '\n'.join(lines) + '\n'
+
+
+def slow_request_threshold():
+    return getattr(settings, 'METRICS_SLOW_REQUEST_SECONDS', SLOW_REQUEST_SECONDS)
+
+
+def trace_sample_rate():
+    return getattr(settings, 'METRICS_TRACE_SAMPLE_RATE', 0.0)
+
+
+def log_slow_request(view, request, duration, stats):
+    lines = [
+        f"Медленный запрос {request.method} {request.path} ({view}): {duration:.3f} с, "
+        f"запросов к БД: {stats.queries} ({stats.query_time:.3f} с)"
+    ]
+    for elapsed, sql in stats.sql or ():
+        lines.append(f"  {elapsed * 1000:.1f} мс: {sql[:1000]}")
+    logger.warning('\n'.join(lines))
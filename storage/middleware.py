@@ -0,0 +1,155 @@
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+from . import metrics, replicas
+
+
+class MetricsMiddleware:
+    """Собирает метрики запроса (см. ``storage.metrics``).
+
+    Работает и под WSGI, и под ASGI. Потоковые ответы считаются
+    завершёнными при ``close()``: до этого передача учитывается в
+    ``mycloud_transfers_in_flight``, а отправленные байты — по
+    ``Content-Length`` или по фактически отданным частям.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats, token, started = self._start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current.reset(token)
+        return self._finish(request, response, stats, started)
+
+    async def __acall__(self, request):
+        stats, token, started = self._start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current.reset(token)
+        return self._finish(request, response, stats, started)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        request._metrics_view = match.url_name or match.view_name
+        metrics.registry.in_flight(request._metrics_view, 1)
+
+    def _start(self, request):
+        stats = metrics.RequestStats(trace=random.random() < metrics.trace_sample_rate())
+        return stats, metrics.current.set(stats), time.perf_counter()
+
+    def _finish(self, request, response, stats, started):
+        duration = time.perf_counter() - started
+        view = getattr(request, '_metrics_view', None)
+        label = view or 'unresolved'
+        try:
+            bytes_in = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            bytes_in = 0
+        metrics.registry.observe(
+            label, request.method, f'{response.status_code // 100}xx', duration, stats, bytes_in,
+        )
+        if stats.sql is not None and duration >= metrics.slow_request_threshold():
+            metrics.log_slow_request(label, request, duration, stats)
+
+        if response.streaming:
+            self._track_stream(response, label, in_flight=view is not None)
+        else:
+            metrics.registry.add_bytes_out(label, len(response.content))
+            if view is not None:
+                metrics.registry.in_flight(view, -1)
+        metrics.registry.maybe_dump()
+        return response
+
+    def _track_stream(self, response, label, in_flight):
+        length = response.get('Content-Length')
+        sent = [0]
+        if length is None:
+            # Без Content-Length считаем части по мере отдачи. FileResponse с
+            # известной длиной не оборачиваем, чтобы сервер мог использовать sendfile.
+            response.streaming_content = (
+                _acount(response.streaming_content, sent) if response.is_async
+                else _count(response.streaming_content, sent)
+            )
+        close = response.close
+
+        def close_and_record():
+            if not sent:
+                return
+            size = sent.pop() if length is None else int(length)
+            sent.clear()
+            try:
+                close()
+            finally:
+                metrics.registry.add_bytes_out(label, size)
+                if in_flight:
+                    metrics.registry.in_flight(label, -1)
+
+        response.close = close_and_record
+
+
+class ReadYourWritesMiddleware:
+    """Отмечает пользователей, запрос которых записал в БД (см. ``storage.replicas``)."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not replicas.enabled():
+            return self.get_response(request)
+        writes, token = replicas.track_writes()
+        try:
+            response = self.get_response(request)
+        finally:
+            replicas.stop_tracking(token)
+        self._remember(request, writes)
+        return response
+
+    async def __acall__(self, request):
+        if not replicas.enabled():
+            return await self.get_response(request)
+        writes, token = replicas.track_writes()
+        try:
+            response = await self.get_response(request)
+        finally:
+            replicas.stop_tracking(token)
+        if writes[0]:
+            await sync_to_async(self._remember)(request, writes)
+        return response
+
+    def _remember(self, request, writes):
+        # DRF кладёт пользователя, найденного по токену, и в исходный запрос.
+        user = getattr(request, 'user', None)
+        if writes[0] and user is not None and user.is_authenticated:
+            replicas.note_write(user.pk)
+
+
+def _count(content, sent):
+    for chunk in content:
+        sent[0] += len(chunk)
+        yield chunk
+
+
+async def _acount(content, sent):
+    async for chunk in content:
+        sent[0] += len(chunk)
+        yield chunk
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.10 on 2026-10-18 07:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0002_alter_user_options_alter_user_full_name_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userfile',
+            index=models.Index(fields=['user', 'upload_date', 'id'], name='userfile_user_uploaded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userfile',
+            index=models.Index(fields=['user', 'original_name', 'id'], name='userfile_user_name_idx'),
+        ),
+    ]
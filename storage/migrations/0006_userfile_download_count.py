@@ -0,0 +1,18 @@
+# Generated by Django 4.2.10 on 2026-10-18 07:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0005_blob_store'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userfile',
+            name='download_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
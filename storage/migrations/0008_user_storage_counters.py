@@ -0,0 +1,45 @@
+# Generated by Django 4.2.10 on 2026-10-18 07:57
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model('storage', 'User')
+    UserFile = apps.get_model('storage', 'UserFile')
+    per_user = UserFile.objects.filter(user=OuterRef('pk')).order_by().values('user')
+    User.objects.update(
+        file_count=Coalesce(
+            Subquery(per_user.annotate(n=Count('id')).values('n')), 0
+        ),
+        total_bytes=Coalesce(
+            Subquery(per_user.annotate(s=Sum('size')).values('s')), 0
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0007_job_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='file_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество файлов'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='quota_bytes',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='Квота, байт'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='total_bytes',
+            field=models.BigIntegerField(default=0, verbose_name='Объём файлов, байт'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
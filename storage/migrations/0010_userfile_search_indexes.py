@@ -0,0 +1,57 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models.functions import Upper
+
+SEARCH_INDEXES = [
+    GinIndex(
+        OpClass(Upper('original_name'), name='gin_trgm_ops'),
+        name='userfile_name_trgm_idx',
+    ),
+    GinIndex(
+        OpClass(Upper('comment'), name='gin_trgm_ops'),
+        name='userfile_comment_trgm_idx',
+    ),
+    GinIndex(
+        SearchVector('original_name', 'comment', config='simple'),
+        name='userfile_search_fts_idx',
+    ),
+]
+
+
+# GIN-индексы есть только в PostgreSQL; на SQLite (тесты) поиск работает без них.
+def add_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    UserFile = apps.get_model('storage', 'UserFile')
+    for index in SEARCH_INDEXES:
+        schema_editor.add_index(UserFile, index)
+
+
+def remove_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    UserFile = apps.get_model('storage', 'UserFile')
+    for index in SEARCH_INDEXES:
+        schema_editor.remove_index(UserFile, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0009_blob_compression'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name='userfile', index=index)
+                for index in SEARCH_INDEXES
+            ],
+            database_operations=[
+                migrations.RunPython(add_search_indexes, remove_search_indexes),
+            ],
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.10 on 2026-10-18 08:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0010_userfile_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScrubFinding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(db_index=True, max_length=64)),
+                ('kind', models.CharField(choices=[('mismatch', 'Не совпадает SHA-256'), ('size', 'Изменился размер'), ('missing', 'Нет файла'), ('unreadable', 'Ошибка чтения')], max_length=16)),
+                ('expected', models.CharField(blank=True, max_length=128)),
+                ('actual', models.CharField(blank=True, max_length=255)),
+                ('detected_at', models.DateTimeField(auto_now_add=True)),
+                ('resolved', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ScrubRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('bytes_due', models.BigIntegerField(default=0)),
+                ('blobs_checked', models.BigIntegerField(default=0)),
+                ('bytes_checked', models.BigIntegerField(default=0)),
+                ('findings', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='blob',
+            name='checked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='blob',
+            index=models.Index(fields=['checked_at'], name='blob_checked_at_idx'),
+        ),
+        migrations.AddField(
+            model_name='scrubfinding',
+            name='run',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='found', to='storage.scrubrun'),
+        ),
+    ]
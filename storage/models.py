@@ -1,7 +1,10 @@
 import uuid
 
 from django.contrib.auth.models import AbstractUser, UserManager
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector
 from django.db import models
+from django.db.models.functions import Upper
 
 
 class User(AbstractUser):
@@ -12,6 +15,15 @@ class User(AbstractUser):
     storage_path = models.CharField(
         max_length=255, blank=True, verbose_name='Путь хранения'
     )
+    file_count = models.PositiveIntegerField(
+        default=0, verbose_name='Количество файлов'
+    )
+    total_bytes = models.BigIntegerField(
+        default=0, verbose_name='Объём файлов, байт'
+    )
+    quota_bytes = models.BigIntegerField(
+        null=True, blank=True, verbose_name='Квота, байт'
+    )
 
     USERNAME_FIELD = 'username'
     REQUIRED_FIELDS = ['full_name', 'email']
@@ -25,6 +37,26 @@ class User(AbstractUser):
         return self.username
 
 
+class Blob(models.Model):
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    size = models.BigIntegerField()
+    # Кодек сжатия на диске ('' — без сжатия) и физический размер файла.
+    codec = models.CharField(max_length=16, blank=True, default='')
+    stored_size = models.BigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Последняя проверка содержимого по sha256 (при загрузке или storage.scrub).
+    checked_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['checked_at'], name='blob_checked_at_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.sha256} ({self.ref_count})"
+
+
 class UserFile(models.Model):
     user = models.ForeignKey(
         User,
@@ -37,7 +69,167 @@ class UserFile(models.Model):
     size = models.BigIntegerField()
     upload_date = models.DateTimeField(auto_now_add=True)
     last_download = models.DateTimeField(null=True, blank=True)
+    download_count = models.PositiveIntegerField(default=0)
     special_link = models.UUIDField(default=uuid.uuid4, unique=True)
+    blob = models.ForeignKey(
+        Blob,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='files'
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', 'upload_date', 'id'],
+                name='userfile_user_uploaded_idx',
+            ),
+            models.Index(
+                fields=['user', 'original_name', 'id'],
+                name='userfile_user_name_idx',
+            ),
+            # Поиск (storage.search), только PostgreSQL: триграммы под
+            # icontains (UPPER(...) LIKE) и полнотекстовый индекс.
+            GinIndex(
+                OpClass(Upper('original_name'), name='gin_trgm_ops'),
+                name='userfile_name_trgm_idx',
+            ),
+            GinIndex(
+                OpClass(Upper('comment'), name='gin_trgm_ops'),
+                name='userfile_comment_trgm_idx',
+            ),
+            GinIndex(
+                SearchVector('original_name', 'comment', config='simple'),
+                name='userfile_search_fts_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.username} — {self.original_name}"
+
+
+class UploadSession(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='upload_sessions'
+    )
+    original_name = models.CharField(max_length=255)
+    comment = models.TextField(blank=True)
+    size = models.BigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    total_chunks = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.user.username} — {self.original_name} ({self.id})"
+
+
+class UploadChunk(models.Model):
+    session = models.ForeignKey(
+        UploadSession,
+        on_delete=models.CASCADE,
+        related_name='chunks'
+    )
+    index = models.PositiveIntegerField()
+    size = models.PositiveIntegerField()
+    checksum = models.CharField(max_length=64)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['session', 'index'], name='uploadchunk_session_index_uniq'
+            ),
+        ]
+
+
+class Job(models.Model):
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'В очереди'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_DONE, 'Завершена'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
+    kind = models.CharField(max_length=64)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(
+        max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED
+    )
+    created_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='jobs'
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    progress_done = models.BigIntegerField(default=0)
+    progress_total = models.BigIntegerField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    run_after = models.DateTimeField()
+    locked_by = models.CharField(max_length=128, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.id} ({self.status})"
+
+
+class ScrubRun(models.Model):
+    """Проход проверки целостности blob'ов (см. ``storage.scrub``)."""
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    bytes_due = models.BigIntegerField(default=0)
+    blobs_checked = models.BigIntegerField(default=0)
+    bytes_checked = models.BigIntegerField(default=0)
+    findings = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Проверка #{self.id} от {self.started_at:%Y-%m-%d %H:%M}"
+
+
+class ScrubFinding(models.Model):
+    KIND_MISMATCH = 'mismatch'
+    KIND_SIZE = 'size'
+    KIND_MISSING = 'missing'
+    KIND_UNREADABLE = 'unreadable'
+    KIND_CHOICES = [
+        (KIND_MISMATCH, 'Не совпадает SHA-256'),
+        (KIND_SIZE, 'Изменился размер'),
+        (KIND_MISSING, 'Нет файла'),
+        (KIND_UNREADABLE, 'Ошибка чтения'),
+    ]
+
+    run = models.ForeignKey(
+        ScrubRun,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='found'
+    )
+    # Не внешний ключ: запись о повреждении остаётся и после удаления blob'а.
+    sha256 = models.CharField(max_length=64, db_index=True)
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    expected = models.CharField(max_length=128, blank=True)
+    actual = models.CharField(max_length=255, blank=True)
+    detected_at = models.DateTimeField(auto_now_add=True)
+    resolved = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"{self.sha256}: {self.kind}"
@@ -0,0 +1,122 @@
+import base64
+import binascii
+import json
+from datetime import date, datetime
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class PaginationError(ValueError):
+    """Некорректные параметры постраничного вывода (курсор, лимит, сортировка)."""
+
+
+def parse_limit(raw_limit):
+    default = getattr(settings, 'API_PAGE_SIZE', DEFAULT_PAGE_SIZE)
+    maximum = getattr(settings, 'API_MAX_PAGE_SIZE', MAX_PAGE_SIZE)
+    if raw_limit in (None, ''):
+        return default
+    try:
+        limit = int(raw_limit)
+    except (TypeError, ValueError):
+        raise PaginationError('Некорректный параметр limit')
+    if limit < 1:
+        raise PaginationError('Некорректный параметр limit')
+    return min(limit, maximum)
+
+
+def parse_sort(raw_sort, allowed, default):
+    """Возвращает (ключ сортировки, по убыванию) из значения вида ``-file_size``."""
+    raw_sort = raw_sort or default
+    descending = raw_sort.startswith('-')
+    key = raw_sort.lstrip('-')
+    if key not in allowed:
+        raise PaginationError(f'Недопустимая сортировка: {key}')
+    return key, descending
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_cursor(sort, values):
+    payload = json.dumps({'s': sort, 'v': list(values)}, default=_json_default)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(raw_cursor, sort):
+    if not raw_cursor:
+        return None
+    try:
+        padded = raw_cursor + '=' * (-len(raw_cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values = payload['v']
+        cursor_sort = payload['s']
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise PaginationError('Некорректный курсор')
+    if cursor_sort != sort or not isinstance(values, list):
+        raise PaginationError('Курсор не соответствует сортировке')
+    return values
+
+
+def keyset_filter(fields, values, descending):
+    """Условие «строго после (values)» для упорядочивания по полям ``fields``.
+
+    Раскрывает сравнение кортежей ``(a, b, id) > (x, y, z)`` в дизъюнкцию,
+    которую планировщик может выполнить как диапазонный скан по индексу.
+    """
+    lookup = 'lt' if descending else 'gt'
+    condition = Q()
+    for i, field in enumerate(fields):
+        term = Q(**{f'{field}__{lookup}': values[i]})
+        for prev_field, prev_value in zip(fields[:i], values[:i]):
+            term &= Q(**{prev_field: prev_value})
+        condition |= term
+    return condition
+
+
+def _cursor_values(queryset, fields, values):
+    """Значения курсора, приведённые к типам полей сортировки (или аннотаций).
+
+    Курсор приходит от клиента: подделанное или устаревшее значение должно
+    давать ``PaginationError``, а не ошибку внутри ORM.
+    """
+    if len(values) != len(fields):
+        raise PaginationError('Курсор не соответствует сортировке')
+    result = []
+    for name, value in zip(fields, values):
+        annotation = queryset.query.annotations.get(name)
+        field = annotation.output_field if annotation is not None else queryset.model._meta.get_field(name)
+        if value is None or isinstance(value, (dict, list)):
+            raise PaginationError('Некорректный курсор')
+        try:
+            result.append(field.to_python(value))
+        except (ValidationError, TypeError, ValueError):
+            raise PaginationError('Некорректный курсор')
+    return result
+
+
+def keyset_page(queryset, fields, descending, cursor_values, limit, sort):
+    """Возвращает (объекты страницы, курсор следующей страницы или None).
+
+    ``fields`` должен заканчиваться уникальным полем (обычно ``id``), чтобы
+    порядок был строгим и строки с одинаковым ключом не терялись между страницами.
+    """
+    if cursor_values is not None:
+        cursor_values = _cursor_values(queryset, fields, cursor_values)
+        queryset = queryset.filter(keyset_filter(fields, cursor_values, descending))
+    prefix = '-' if descending else ''
+    queryset = queryset.order_by(*[f'{prefix}{field}' for field in fields])
+    items = list(queryset[:limit + 1])
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_cursor(sort, [getattr(last, field) for field in fields])
+    return items, next_cursor
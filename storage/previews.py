@@ -0,0 +1,244 @@
+"""Уменьшенные копии изображений (превью) с кэшем на диске.
+
+Превью строится из содержимого blob'а для одного из размеров ``BUCKETS``
+(запрошенный размер округляется вверх) и хранится в
+``MEDIA_ROOT/previews/ab/<sha256>-<размер>.jpg``. Ключ — содержимое, поэтому
+одинаковые файлы разных пользователей делят превью, а удаляются превью
+вместе с байтами blob'а (см. ``blobs.release``).
+
+Превью строятся в пуле процессов ``spawn`` ограниченного размера; если
+очередь заполнена, вызывающий получает ``PreviewBusy``. Модуль не
+импортирует модели: его загружают дочерние процессы без настроенного Django.
+Кэш ограничен ``PREVIEW_CACHE_MAX_BYTES``: при переполнении удаляются
+превью, к которым дольше всего не обращались (по ``mtime``, который
+обновляется при обращении не чаще раза в ``TOUCH_INTERVAL``).
+"""
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+
+from . import compression
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow не установлен: превью недоступны
+    Image = ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = (128, 256, 512, 1024)
+DEFAULT_BUCKET = 256
+EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.avif', '.bmp', '.tif', '.tiff'}
+CONTENT_TYPE = 'image/jpeg'
+JPEG_QUALITY = 80
+MAX_SOURCE_PIXELS = 60_000_000
+CACHE_MAX_BYTES = 1024 ** 3
+# После вытеснения кэш занимает не больше этой доли лимита.
+EVICT_TO = 0.9
+TOUCH_INTERVAL = 3600
+WORKERS = 2
+QUEUE_PER_WORKER = 4
+TIMEOUT = 30
+
+
+class PreviewUnavailable(Exception):
+    pass
+
+
+class PreviewBusy(Exception):
+    pass
+
+
+def enabled():
+    return Image is not None and getattr(settings, 'PREVIEWS_ENABLED', True)
+
+
+def supported(name):
+    return os.path.splitext(name)[1].lower() in EXTENSIONS
+
+
+def bucket_for(size):
+    """Наименьший размер из ``BUCKETS`` не меньше ``size``."""
+    for bucket in BUCKETS:
+        if size <= bucket:
+            return bucket
+    return BUCKETS[-1]
+
+
+def previews_root():
+    return os.path.join(settings.MEDIA_ROOT, 'previews')
+
+
+def preview_path(sha256, bucket):
+    return os.path.join(previews_root(), sha256[:2], f'{sha256}-{bucket}.jpg')
+
+
+def _workers():
+    return getattr(settings, 'PREVIEW_WORKERS', WORKERS)
+
+
+def _cache_max_bytes():
+    return getattr(settings, 'PREVIEW_CACHE_MAX_BYTES', CACHE_MAX_BYTES)
+
+
+def render(source, codec, target, bucket):
+    """Строит превью ``source`` в ``target``. Выполняется в процессе пула."""
+    Image.MAX_IMAGE_PIXELS = MAX_SOURCE_PIXELS
+    with compression.open_stored(source, codec) as src, Image.open(src) as image:
+        # Для JPEG декодирует сразу в уменьшенном масштабе.
+        image.draft('RGB', (bucket, bucket))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((bucket, bucket))
+        if image.mode not in ('RGB', 'L'):
+            rgba = image.convert('RGBA')
+            image = Image.new('RGB', rgba.size, (255, 255, 255))
+            image.paste(rgba, mask=rgba.getchannel('A'))
+        tmp_path = f'{target}.{os.getpid()}.tmp'
+        try:
+            image.save(tmp_path, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+            os.replace(tmp_path, target)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return os.path.getsize(target)
+
+
+_lock = threading.RLock()
+_pool = None
+_pool_pid = None
+_pending = {}
+_written_since_check = None
+_evict_due = False
+
+
+def _submit(*args):
+    global _pool, _pool_pid
+    if _pool is not None and _pool_pid == os.getpid():
+        try:
+            return _pool.submit(render, *args)
+        except BrokenProcessPool:
+            # Процесс пула упал (например, по памяти): создаём пул заново.
+            _pool.shutdown(wait=False)
+    _pool = ProcessPoolExecutor(max_workers=_workers(), mp_context=multiprocessing.get_context('spawn'))
+    _pool_pid = os.getpid()
+    return _pool.submit(render, *args)
+
+
+def _touch(path):
+    try:
+        if time.time() - os.stat(path).st_mtime >= TOUCH_INTERVAL:
+            os.utime(path)
+    except FileNotFoundError:
+        pass
+
+
+def get_or_create(sha256, source, codec, bucket):
+    """Путь к превью, построенному при необходимости.
+
+    Одновременные запросы одного превью ждут одного построения.
+    """
+    target = preview_path(sha256, bucket)
+    if os.path.exists(target):
+        _touch(target)
+        return target
+    with _lock:
+        future = _pending.get(target)
+        if future is None:
+            if len(_pending) >= _workers() * QUEUE_PER_WORKER:
+                raise PreviewBusy()
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            future = _submit(source, codec, target, bucket)
+            _pending[target] = future
+            future.add_done_callback(lambda done: _finished(target, done))
+    try:
+        future.result(timeout=getattr(settings, 'PREVIEW_TIMEOUT', TIMEOUT))
+    except FutureTimeoutError:
+        raise PreviewBusy()
+    except Exception as e:
+        logger.error(f"Не удалось построить превью {sha256} ({bucket}): {str(e)}")
+        raise PreviewUnavailable() from e
+    if _take_evict_due():
+        evict()
+    return target
+
+
+def _finished(target, future):
+    """Вызывается пулом по завершении построения."""
+    global _written_since_check, _evict_due
+    with _lock:
+        _pending.pop(target, None)
+        if future.cancelled() or future.exception() is not None:
+            return
+        # Размер кэша пересчитывается обходом после записи каждой десятой
+        # части лимита (и после первой записи в процессе).
+        if _written_since_check is not None:
+            _written_since_check += future.result()
+            if _written_since_check < _cache_max_bytes() * (1 - EVICT_TO):
+                return
+        _written_since_check = 0
+        _evict_due = True
+
+
+def _take_evict_due():
+    global _evict_due
+    with _lock:
+        due, _evict_due = _evict_due, False
+    return due
+
+
+def evict(max_bytes=None):
+    """Удаляет давно не использованные превью, если кэш больше лимита.
+
+    Возвращает число удалённых файлов.
+    """
+    max_bytes = _cache_max_bytes() if max_bytes is None else max_bytes
+    entries = []
+    total = 0
+    for shard in _scandir(previews_root()):
+        if not shard.is_dir(follow_symlinks=False):
+            continue
+        for entry in _scandir(shard.path):
+            if entry.name.endswith('.jpg'):
+                try:
+                    stat_result = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat_result.st_mtime, stat_result.st_size, entry.path))
+                total += stat_result.st_size
+    if total <= max_bytes:
+        return 0
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes * EVICT_TO:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return removed
+
+
+def _scandir(path):
+    try:
+        with os.scandir(path) as entries:
+            return list(entries)
+    except FileNotFoundError:
+        return []
+
+
+def discard(sha256):
+    """Удаляет все превью содержимого ``sha256``."""
+    for bucket in BUCKETS:
+        try:
+            os.remove(preview_path(sha256, bucket))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,211 @@
+"""Сверка файлов на диске с БД (команда ``reconcile_storage``).
+
+Единица работы — шард хранилища blob'ов (``blobs/ab``), каталог временных
+файлов ``blobs/tmp`` или каталог пользователя с ещё не перенесёнными в
+хранилище blob'ов файлами. Каталоги обходятся через ``os.scandir`` в пуле
+потоков на несколько единиц вперёд, а строки БД для единицы читаются
+потоком через ``.iterator()``. В памяти одновременно держатся только
+списки файлов нескольких единиц.
+
+Найденное расхождение перед исправлением проверяется заново: за время обхода
+файл могли загрузить, перенести или удалить. Файлы моложе ``min_age`` не
+считаются лишними — это могут быть загрузки, ещё не зафиксированные в БД.
+"""
+import logging
+import os
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import transaction
+
+from . import blobs, compression, links, usage
+from .models import Blob, User, UserFile
+
+logger = logging.getLogger(__name__)
+
+ORPHAN = 'orphan'
+MISSING = 'missing'
+STALE_TMP = 'stale_tmp'
+
+BLOB_SHARDS = [f'{i:02x}' for i in range(256)]
+TMP_MAX_AGE = 24 * 60 * 60
+USER_BATCH_SIZE = 500
+
+Unit = namedtuple('Unit', 'kind key root')
+# ref — sha256 пропавшего blob'а или id записи пропавшего файла.
+Finding = namedtuple('Finding', 'kind path ref')
+
+
+def quarantine_root():
+    return os.path.join(settings.MEDIA_ROOT, '.orphans')
+
+
+def units(after_shard=None, after_user_id=0):
+    """Единицы сверки в порядке обхода, начиная после указанной позиции."""
+    if after_shard is None and not after_user_id:
+        yield Unit('tmp', None, os.path.join(blobs.blobs_root(), 'tmp'))
+    if not after_user_id:
+        for shard in BLOB_SHARDS:
+            if after_shard is None or shard > after_shard:
+                yield Unit('blobs', shard, os.path.join(blobs.blobs_root(), shard))
+    last_id = after_user_id
+    while True:
+        users = list(
+            User.objects.filter(id__gt=last_id).exclude(storage_path='')
+            .order_by('id').only('id', 'storage_path')[:USER_BATCH_SIZE]
+        )
+        if not users:
+            break
+        for user in users:
+            yield Unit('user', user.id, blobs.user_root(user))
+        last_id = users[-1].id
+
+
+def scan_tree(root):
+    """Файлы под ``root`` на любой глубине: ``{имя: путь}``.
+
+    Выполняется в потоках пула, к БД не обращается.
+    """
+    files = {}
+    pending = [root]
+    while pending:
+        try:
+            entries = os.scandir(pending.pop())
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    files[entry.name] = entry.path
+    return files
+
+
+def _older_than(path, age):
+    try:
+        return time.time() - os.stat(path).st_mtime >= age
+    except FileNotFoundError:
+        return False
+
+
+def diff(unit, files, batch_size, min_age):
+    """Расхождения единицы ``unit`` по списку её файлов ``files``.
+
+    Возвращает ``(findings, число проверенных строк БД)``.
+    """
+    if unit.kind == 'tmp':
+        age = max(min_age, TMP_MAX_AGE)
+        return [Finding(STALE_TMP, path, None) for path in files.values() if _older_than(path, age)], 0
+
+    findings = []
+    rows = 0
+    if unit.kind == 'blobs':
+        blob_rows = (
+            Blob.objects.filter(sha256__startswith=unit.key)
+            .values_list('sha256', 'codec', 'ref_count')
+            .iterator(chunk_size=batch_size)
+        )
+        for sha256, codec, ref_count in blob_rows:
+            rows += 1
+            if files.pop(sha256 + compression.SUFFIXES.get(codec, ''), None) is None and ref_count > 0:
+                findings.append(Finding(MISSING, blobs.blob_path(sha256, codec), sha256))
+    else:
+        user_rows = (
+            UserFile.objects.filter(user_id=unit.key, blob__isnull=True)
+            .values_list('id', 'stored_name')
+            .iterator(chunk_size=batch_size)
+        )
+        for file_id, stored_name in user_rows:
+            rows += 1
+            if files.pop(stored_name, None) is None:
+                path = blobs.fanout_path(unit.root, stored_name, stored_name, blobs.fanout_levels())
+                findings.append(Finding(MISSING, path, file_id))
+    findings.extend(Finding(ORPHAN, path, None) for path in files.values() if _older_than(path, min_age))
+    return findings, rows
+
+
+def _parse_blob_name(name):
+    for codec, suffix in compression.SUFFIXES.items():
+        if suffix and name.endswith(suffix):
+            return name[:-len(suffix)], codec
+    return name, ''
+
+
+def confirm(unit, finding, min_age):
+    """Повторная проверка расхождения перед исправлением."""
+    if finding.kind == STALE_TMP:
+        return _older_than(finding.path, max(min_age, TMP_MAX_AGE))
+    if finding.kind == ORPHAN:
+        if not _older_than(finding.path, min_age):
+            return False
+        name = os.path.basename(finding.path)
+        if unit.kind == 'blobs':
+            sha256, codec = _parse_blob_name(name)
+            return not Blob.objects.filter(sha256=sha256, codec=codec).exists()
+        # Файл мог перейти к другому пользователю и ещё лежать на старом месте.
+        return not UserFile.objects.filter(stored_name=name).exists()
+    if unit.kind == 'blobs':
+        blob = Blob.objects.filter(sha256=finding.ref, ref_count__gt=0).first()
+        return blob is not None and not os.path.exists(blobs.blob_path(blob.sha256, blob.codec))
+    user_file = UserFile.objects.select_related('user').filter(id=finding.ref, blob__isnull=True).first()
+    return user_file is not None and not os.path.exists(blobs.legacy_file_path(user_file))
+
+
+def repair(unit, finding):
+    """Исправляет подтверждённое расхождение. Возвращает описание действия."""
+    if finding.kind == STALE_TMP:
+        os.remove(finding.path)
+        return 'удалён'
+    if finding.kind == ORPHAN:
+        if unit.kind == 'blobs':
+            return _quarantine_blob(finding.path)
+        _quarantine(finding.path)
+        return 'перенесён в .orphans'
+    if unit.kind == 'blobs':
+        removed = delete_files(UserFile.objects.filter(blob_id=finding.ref).values_list('id', flat=True))
+    else:
+        removed = delete_files([finding.ref])
+    return f'удалено записей: {removed}'
+
+
+def _quarantine(path):
+    target = os.path.join(quarantine_root(), os.path.relpath(path, settings.MEDIA_ROOT))
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(path, target)
+
+
+def _quarantine_blob(path):
+    sha256, codec = _parse_blob_name(os.path.basename(path))
+    with transaction.atomic():
+        # Строка-якорь блокирует загрузку того же содержимого (см. blobs.ingest),
+        # пока файл убирается.
+        size = os.path.getsize(path)
+        blob, created = Blob.objects.select_for_update().get_or_create(
+            sha256=sha256, defaults={'size': size, 'codec': codec, 'stored_size': size, 'ref_count': 0}
+        )
+        if blob.ref_count > 0 and blob.codec == codec:
+            return 'пропущен: появилась запись'
+        _quarantine(path)
+        if created:
+            blob.delete()
+    return 'перенесён в .orphans'
+
+
+def delete_files(file_ids):
+    """Удаляет записи ``UserFile`` без содержимого вместе со счётчиками."""
+    with transaction.atomic():
+        user_files = list(
+            UserFile.objects.select_for_update()
+            .filter(id__in=list(file_ids))
+            .only('id', 'user', 'size', 'blob', 'special_link')
+        )
+        files = UserFile.objects.filter(id__in=[f.id for f in user_files])
+        blobs.release(blobs.blob_counts(files))
+        usage.apply_deltas(usage.removal_deltas(user_files))
+        files.delete()
+    links.invalidate(*(f.special_link for f in user_files))
+    for user_file in user_files:
+        logger.warning(f"Удалена запись файла без содержимого: id={user_file.id}")
+    return len(user_files)
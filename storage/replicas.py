@@ -0,0 +1,200 @@
+"""Чтение с реплик БД для эндпоинтов, которые ничего не пишут.
+
+Реплики — алиасы из ``DATABASES``, перечисленные в ``DATABASE_REPLICAS``.
+Представление, обёрнутое в ``read_replica``, выполняет чтения на одной из
+здоровых реплик; аутентификация (она выполняется до тела представления) и
+все записи идут в ``default`` через ``ReplicaRouter``.
+
+Read-your-writes: ``ReadYourWritesMiddleware`` отмечает в общем кэше Django
+пользователя, запрос которого что-то записал, и следующие
+``REPLICA_READ_YOUR_WRITES_SECONDS`` секунд его чтения идут в ``default``.
+Отметку должны видеть все процессы, поэтому нужен общий ``CACHES`` (Redis,
+Memcached); с кэшем в памяти процесса следующий запрос, попавший в другой
+воркер, прочитал бы с реплики устаревшие данные. Без общего кэша чтение с
+реплик не включается, а в лог пишется ошибка.
+
+Реплика проверяется не чаще раза в ``REPLICA_CHECK_INTERVAL`` секунд:
+подключение и, для PostgreSQL, отставание применения WAL не больше
+``REPLICA_MAX_LAG_SECONDS``. Если реплика отвечает ошибкой во время
+запроса, она исключается до следующей проверки, а представление
+выполняется заново на ``default``.
+"""
+import contextvars
+import functools
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, OperationalError, connections
+
+from . import metrics
+from .caching import shared_cache
+
+logger = logging.getLogger(__name__)
+
+READ_YOUR_WRITES_SECONDS = 5
+CHECK_INTERVAL = 10
+MAX_LAG_SECONDS = 5
+
+# Отставание реплики PostgreSQL, с; 0 — всё полученное уже применено,
+# NULL — сервер не реплика.
+LAG_SQL = (
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+_read_alias = contextvars.ContextVar('replica_read_alias', default=None)
+# [True], если за время запроса была запись (см. ReadYourWritesMiddleware).
+_writes = contextvars.ContextVar('replica_writes', default=None)
+
+_lock = threading.Lock()
+# алиас -> (здорова ли, время проверки по time.monotonic())
+_health = {}
+_reported_no_shared_cache = False
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def enabled():
+    """Заданы реплики и общий для процессов кэш для read-your-writes."""
+    global _reported_no_shared_cache
+    if not replicas():
+        return False
+    if shared_cache() is not None:
+        return True
+    if not _reported_no_shared_cache:
+        _reported_no_shared_cache = True
+        logger.error(f"DATABASE_REPLICAS задан, но CACHES не общий для процессов: чтение идёт из {DEFAULT_DB_ALIAS}")
+    return False
+
+
+def _window():
+    return getattr(settings, 'REPLICA_READ_YOUR_WRITES_SECONDS', READ_YOUR_WRITES_SECONDS)
+
+
+def _write_key(user_id):
+    return f'replica-recent-write:{user_id}'
+
+
+class ReplicaRouter:
+    """Роутер для ``DATABASE_ROUTERS``."""
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        writes = _writes.get()
+        if writes is not None:
+            writes[0] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # На репликах те же данные, что и в default.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in replicas()
+
+
+def _check(alias):
+    connection = connections[alias]
+    try:
+        connection.ensure_connection()
+        if connection.vendor != 'postgresql':
+            return True
+        with connection.cursor() as cursor:
+            cursor.execute(LAG_SQL)
+            lag = cursor.fetchone()[0]
+    except DatabaseError as e:
+        logger.error(f"Реплика {alias} недоступна: {str(e)}")
+        connection.close()
+        return False
+    max_lag = getattr(settings, 'REPLICA_MAX_LAG_SECONDS', MAX_LAG_SECONDS)
+    if lag is not None and lag > max_lag:
+        logger.warning(f"Реплика {alias} отстаёт на {lag:.1f} с")
+        return False
+    return True
+
+
+def healthy_replicas():
+    """Реплики, прошедшие последнюю проверку; проверка повторяется по интервалу."""
+    interval = getattr(settings, 'REPLICA_CHECK_INTERVAL', CHECK_INTERVAL)
+    now = time.monotonic()
+    result = []
+    for alias in replicas():
+        with _lock:
+            state = _health.get(alias)
+        if state is None or now - state[1] >= interval:
+            state = (_check(alias), now)
+            with _lock:
+                _health[alias] = state
+        if state[0]:
+            result.append(alias)
+    return result
+
+
+def health():
+    """Состояние реплик по последним проверкам в этом процессе."""
+    with _lock:
+        return {alias: _health.get(alias, (False, 0))[0] for alias in replicas()}
+
+
+def _mark_down(alias, error):
+    logger.error(f"Ошибка чтения с реплики {alias}, запрос повторяется на {DEFAULT_DB_ALIAS}: {str(error)}")
+    with _lock:
+        _health[alias] = (False, time.monotonic())
+    try:
+        connections[alias].close()
+    except DatabaseError:
+        pass
+
+
+def note_write(user_id):
+    """Следующие чтения пользователя какое-то время идут в ``default``."""
+    shared_cache().set(_write_key(user_id), 1, _window())
+
+
+def _choose(user):
+    if user is not None and user.is_authenticated and shared_cache().get(_write_key(user.pk)):
+        return None
+    healthy = healthy_replicas()
+    return random.choice(healthy) if healthy else None
+
+
+def read_replica(view):
+    """Выполняет чтения представления на реплике.
+
+    Ставится под ``@api_view``, чтобы аутентификация шла в ``default``.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not enabled():
+            return view(request, *args, **kwargs)
+        alias = _choose(getattr(request, 'user', None))
+        metrics.registry.add('db_routed_reads', alias or DEFAULT_DB_ALIAS)
+        if alias is None:
+            return view(request, *args, **kwargs)
+        token = _read_alias.set(alias)
+        try:
+            return view(request, *args, **kwargs)
+        except OperationalError as e:
+            _mark_down(alias, e)
+        finally:
+            _read_alias.reset(token)
+        metrics.registry.add('db_routed_reads', DEFAULT_DB_ALIAS)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def track_writes():
+    """Начинает учёт записей текущего запроса; возвращает ``(флаг, токен)``."""
+    writes = [False]
+    return writes, _writes.set(writes)
+
+
+def stop_tracking(token):
+    _writes.reset(token)
@@ -0,0 +1,208 @@
+"""Проверка целостности хранилища blob'ов (команда ``scrub_blobs``).
+
+Содержимое каждого blob'а с ссылками заново хешируется и сравнивается с
+``Blob.sha256``, размер файла на диске — с ``stored_size``, а распакованный
+размер — с ``size``. Первыми проверяются blob'ы, которые дольше всего не
+проверялись (``checked_at``); blob'ы, проверенные позже ``interval`` назад,
+пропускаются, поэтому прерванный проход просто продолжается при следующем
+запуске. Новые blob'ы получают ``checked_at`` при загрузке: их хеш уже
+посчитан.
+
+Файлы читаются в пуле процессов (хеширование и распаковка упираются в CPU),
+суммарная скорость чтения ограничена ``bandwidth`` байт/с. Расхождения
+записываются в ``ScrubFinding``, ход прохода — в ``ScrubRun``.
+"""
+import gzip
+import hashlib
+import logging
+import multiprocessing
+import os
+import time
+import zlib
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from . import blobs, compression
+from .models import Blob, ScrubFinding, ScrubRun
+
+logger = logging.getLogger(__name__)
+
+READ_BLOCK_SIZE = 1024 * 1024
+PROGRESS_INTERVAL = 5.0
+INTERVAL_DAYS = 30
+RECENT_FINDINGS = 20
+
+
+def interval():
+    return timedelta(days=getattr(settings, 'SCRUB_INTERVAL_DAYS', INTERVAL_DAYS))
+
+
+def due_blobs(now=None):
+    """Blob'ы, которые пора проверить."""
+    cutoff = (now or timezone.now()) - interval()
+    return Blob.objects.filter(ref_count__gt=0).filter(
+        Q(checked_at__isnull=True) | Q(checked_at__lt=cutoff)
+    )
+
+
+class _ThrottledReader:
+    """Файл, из которого читается не больше ``rate`` байт/с (0 — без ограничения)."""
+
+    def __init__(self, raw, rate):
+        self.raw = raw
+        self.rate = rate
+        self.read_bytes = 0
+        self.started = time.monotonic()
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.read_bytes += len(data)
+        if self.rate:
+            delay = self.read_bytes / self.rate - (time.monotonic() - self.started)
+            if delay > 0:
+                time.sleep(delay)
+        return data
+
+
+def verify(sha256, path, codec, size, stored_size, rate):
+    """Проверяет один blob. Выполняется в процессе пула, к БД не обращается.
+
+    Возвращает ``(sha256, вид расхождения или None, ожидалось, получено,
+    прочитано байт)``.
+    """
+    try:
+        on_disk = os.path.getsize(path)
+    except FileNotFoundError:
+        return sha256, ScrubFinding.KIND_MISSING, path, '', 0
+    if on_disk != stored_size:
+        return sha256, ScrubFinding.KIND_SIZE, str(stored_size), str(on_disk), 0
+    digest = hashlib.sha256()
+    length = 0
+    try:
+        with open(path, 'rb') as raw:
+            reader = _ThrottledReader(raw, rate)
+            source = gzip.GzipFile(fileobj=reader) if codec == compression.CODEC_GZIP else reader
+            for block in iter(lambda: source.read(READ_BLOCK_SIZE), b''):
+                digest.update(block)
+                length += len(block)
+    except (OSError, EOFError, zlib.error) as e:
+        return sha256, ScrubFinding.KIND_UNREADABLE, '', str(e)[:255], on_disk
+    if length != size:
+        return sha256, ScrubFinding.KIND_SIZE, str(size), str(length), on_disk
+    if digest.hexdigest() != sha256:
+        return sha256, ScrubFinding.KIND_MISMATCH, sha256, digest.hexdigest(), on_disk
+    return sha256, None, '', '', on_disk
+
+
+def _still_stored(sha256, codec):
+    """Не сменились ли файл blob'а за время проверки (сжатие, удаление)."""
+    blob = Blob.objects.filter(sha256=sha256).only('codec', 'ref_count').first()
+    return blob is not None and blob.ref_count > 0 and blob.codec == codec
+
+
+def scrub(workers=2, bandwidth=0, max_seconds=None, max_bytes=None, batch_size=200):
+    """Проверяет blob'ы в порядке давности проверки. Возвращает ``ScrubRun``.
+
+    ``bandwidth`` — суммарная скорость чтения, байт/с (0 — без ограничения);
+    ``max_seconds`` и ``max_bytes`` ограничивают один запуск.
+    """
+    run = ScrubRun.objects.create(
+        bytes_due=due_blobs().aggregate(total=Sum('stored_size'))['total'] or 0
+    )
+    rate = bandwidth / workers if bandwidth else 0
+    deadline = time.monotonic() + max_seconds if max_seconds else None
+    scheduled = 0
+    pending = deque()
+    in_flight = {}
+    last_progress = time.monotonic()
+
+    context = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        exhausted = False
+        while True:
+            while not exhausted and len(in_flight) < workers * 2:
+                if (deadline and time.monotonic() >= deadline) or (max_bytes and scheduled >= max_bytes):
+                    exhausted = True
+                    break
+                if not pending:
+                    pending.extend(
+                        due_blobs().exclude(sha256__in=[item[0] for item in in_flight.values()])
+                        .order_by(F('checked_at').asc(nulls_first=True), 'sha256')
+                        .values_list('sha256', 'codec', 'size', 'stored_size')[:batch_size]
+                    )
+                    if not pending:
+                        exhausted = True
+                        break
+                sha256, codec, size, stored_size = item = pending.popleft()
+                future = pool.submit(
+                    verify, sha256, blobs.blob_path(sha256, codec), codec, size, stored_size, rate,
+                )
+                in_flight[future] = item
+                scheduled += stored_size
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                _record(run, in_flight.pop(future), future.result())
+            if time.monotonic() - last_progress >= PROGRESS_INTERVAL:
+                run.save(update_fields=['blobs_checked', 'bytes_checked', 'findings', 'updated_at'])
+                last_progress = time.monotonic()
+
+    run.finished_at = timezone.now()
+    run.save()
+    return run
+
+
+def _record(run, item, result):
+    sha256, kind, expected, actual, read_bytes = result
+    if kind is not None and not _still_stored(sha256, item[1]):
+        return
+    Blob.objects.filter(sha256=sha256).update(checked_at=timezone.now())
+    run.blobs_checked += 1
+    run.bytes_checked += read_bytes
+    if kind is None:
+        return
+    run.findings += 1
+    ScrubFinding.objects.create(run=run, sha256=sha256, kind=kind, expected=expected, actual=actual)
+    logger.error(f"Повреждён blob {sha256}: {kind}, ожидалось {expected!r}, получено {actual!r}")
+
+
+def status():
+    """Сводка для администратора: сколько осталось, скорость, последние расхождения."""
+    now = timezone.now()
+    due = due_blobs(now).aggregate(count=Count('sha256'), bytes=Sum('stored_size'))
+    last_run = ScrubRun.objects.order_by('-id').first()
+    result = {
+        'interval_days': interval().days,
+        'due_blobs': due['count'],
+        'due_bytes': due['bytes'] or 0,
+        'oldest_check': Blob.objects.filter(ref_count__gt=0)
+        .order_by(F('checked_at').asc(nulls_first=True))
+        .values_list('checked_at', flat=True).first(),
+        'open_findings': ScrubFinding.objects.filter(resolved=False).count(),
+        'recent_findings': list(
+            ScrubFinding.objects.filter(resolved=False).order_by('-id')
+            .values('sha256', 'kind', 'expected', 'actual', 'detected_at')[:RECENT_FINDINGS]
+        ),
+        'last_run': None,
+    }
+    if last_run is not None:
+        elapsed = ((last_run.finished_at or last_run.updated_at) - last_run.started_at).total_seconds()
+        throughput = last_run.bytes_checked / elapsed if elapsed > 0 else None
+        result['last_run'] = {
+            'id': last_run.id,
+            'started_at': last_run.started_at,
+            'finished_at': last_run.finished_at,
+            'blobs_checked': last_run.blobs_checked,
+            'bytes_checked': last_run.bytes_checked,
+            'findings': last_run.findings,
+            'throughput_bytes_per_s': round(throughput) if throughput else None,
+            # Оценка времени до конца прохода при скорости последнего запуска.
+            'eta_seconds': round(result['due_bytes'] / throughput) if throughput else None,
+        }
+    return result
@@ -0,0 +1,56 @@
+"""Поиск файлов по имени и комментарию.
+
+В PostgreSQL подстрока ищется через ``icontains`` по GIN-индексам
+``gin_trgm_ops`` на ``UPPER(original_name)`` и ``UPPER(comment)``, слова —
+полнотекстовым поиском по индексу ``userfile_search_fts_idx``. Релевантность —
+сходство по триграммам плюс ``ts_rank``. На других СУБД (SQLite в тестах)
+остаются ``icontains`` и упрощённый ранг: точное имя, начало имени,
+вхождение в имя, вхождение в комментарий.
+"""
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db import connections
+from django.db.models import Case, FloatField, Q, Value, When
+from django.db.models.functions import Greatest
+
+MIN_QUERY_LENGTH = 2
+MAX_QUERY_LENGTH = 200
+# Конфигурация без стемминга: номера накладных и коды не должны изменяться.
+SEARCH_CONFIG = 'simple'
+
+
+def _postgres_rank(query):
+    vector = SearchVector('original_name', 'comment', config=SEARCH_CONFIG)
+    search_query = SearchQuery(query, config=SEARCH_CONFIG)
+    return (
+        Q(original_name__icontains=query) | Q(comment__icontains=query) | Q(search=search_query),
+        {'search': vector},
+        Greatest(
+            TrigramSimilarity('original_name', query),
+            TrigramSimilarity('comment', query),
+        ) + SearchRank(vector, search_query),
+    )
+
+
+def _fallback_rank(query):
+    return (
+        Q(original_name__icontains=query) | Q(comment__icontains=query),
+        {},
+        Case(
+            When(original_name__iexact=query, then=Value(3.0)),
+            When(original_name__istartswith=query, then=Value(2.0)),
+            When(original_name__icontains=query, then=Value(1.0)),
+            default=Value(0.5),
+            output_field=FloatField(),
+        ),
+    )
+
+
+def search_files(queryset, query):
+    """Отбирает из ``queryset`` файлы, подходящие под ``query``, с полем ``rank``."""
+    if connections[queryset.db].vendor == 'postgresql':
+        condition, extra, rank = _postgres_rank(query)
+    else:
+        condition, extra, rank = _fallback_rank(query)
+    if extra:
+        queryset = queryset.alias(**extra)
+    return queryset.filter(condition).annotate(rank=rank)
@@ -44,7 +44,6 @@ class RegisterSerializer(serializers.ModelSerializer):
         }
 
     def validate_username(self, value):
-        logger.info(f"Validating username: {value}")
         if not value or not value.strip():
             raise serializers.ValidationError('Поле "Имя пользователя" не может быть пустым')
         
@@ -54,7 +53,6 @@ class RegisterSerializer(serializers.ModelSerializer):
         return value.strip()
 
     def validate_email(self, value):
-        logger.info(f"Validating email: {value}")
         if User.objects.filter(email=value).exists():
             raise serializers.ValidationError('Пользователь с таким email уже существует')
         return value
@@ -68,13 +66,8 @@ class RegisterSerializer(serializers.ModelSerializer):
         
         return value.strip()
 
-    def validate(self, attrs):
-        logger.info(f"Validating registration data: {list(attrs.keys())}")
-        return attrs
-
     def create(self, validated_data):
         try:
-            logger.info(f"Creating user with data: {list(validated_data.keys())}")
             full_name = validated_data.pop('full_name')
             
             user = User.objects.create_user(
@@ -88,7 +81,7 @@ class RegisterSerializer(serializers.ModelSerializer):
             
             user.storage_path = f"users/{user.id}_{user.username}/"
             user.save()
-            logger.info(f"User created successfully: {user.username}")
+            logger.debug("User created successfully: %s", user.username)
             return user
         except Exception as e:
             logger.error(f"Error creating user: {str(e)}")
@@ -111,7 +104,6 @@ class LoginSerializer(serializers.Serializer):
     )
 
     def validate(self, attrs):
-        logger.info(f"Validating login for user: {attrs.get('username', 'unknown')}")
         username = attrs.get('username')
         password = attrs.get('password')
 
@@ -128,7 +120,7 @@ class LoginSerializer(serializers.Serializer):
             raise serializers.ValidationError('Учетная запись отключена')
         
         attrs['user'] = user
-        logger.info(f"Login successful for user: {username}")
+        logger.debug("Login credentials valid for user: %s", username)
         return attrs
 
 
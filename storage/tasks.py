@@ -0,0 +1,73 @@
+"""Обработчики фоновых задач (см. ``storage.jobs``)."""
+import logging
+import os
+
+from django.conf import settings
+from django.db import transaction
+
+from . import blobs, links, previews, usage
+from .jobs import handler
+from .models import User, UserFile
+
+logger = logging.getLogger(__name__)
+
+DELETE_BATCH_SIZE = 500
+
+
+@handler('delete_user')
+def delete_user(ctx, user_id):
+    """Удаляет файлы пользователя пакетами, затем саму учётную запись.
+
+    Каждый пакет удаляется в своей транзакции, поэтому после сбоя повторный
+    запуск продолжает с оставшихся файлов.
+    """
+    try:
+        user = User.objects.get(id=user_id)
+    except User.DoesNotExist:
+        return
+    remaining = user.files.count()
+    total = ctx.job.progress_total or remaining
+    ctx.progress(total - remaining, total)
+
+    while True:
+        batch = list(
+            user.files.order_by('id').only('id', 'user', 'stored_name', 'size', 'blob', 'special_link')[:DELETE_BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for user_file in batch:
+            if user_file.blob_id:
+                continue
+            file_path = blobs.legacy_file_path(user_file, user)
+            try:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+            except OSError as e:
+                logger.error(f"Не удалось удалить файл {file_path}: {str(e)}")
+        with transaction.atomic():
+            files = UserFile.objects.filter(id__in=[f.id for f in batch])
+            blobs.release(blobs.blob_counts(files))
+            usage.apply_deltas(usage.removal_deltas(batch))
+            files.delete()
+        links.invalidate(*(f.special_link for f in batch))
+        remaining -= len(batch)
+        ctx.progress(total - remaining)
+
+    if user.storage_path:
+        blobs.remove_empty_dirs(blobs.user_root(user))
+    user.delete()
+
+
+@handler('generate_previews')
+def generate_previews(ctx, file_id):
+    """Строит превью загруженного изображения размеров ``PREVIEW_UPLOAD_SIZES``."""
+    user_file = UserFile.objects.select_related('blob').filter(id=file_id).first()
+    if user_file is None or not user_file.blob_id:
+        return
+    path = blobs.user_file_path(user_file)
+    for size in getattr(settings, 'PREVIEW_UPLOAD_SIZES', []):
+        try:
+            previews.get_or_create(user_file.blob_id, path, user_file.blob.codec, previews.bucket_for(size))
+        except previews.PreviewUnavailable:
+            # Не изображение или повреждённый файл: повторять бесполезно.
+            return
@@ -0,0 +1,71 @@
+"""Обработчик multipart-загрузки, пишущий файл сразу в хранилище blob'ов.
+
+Стандартный ``TemporaryFileUploadHandler`` пишет файл во временный каталог,
+после чего его пришлось бы ещё раз скопировать в хранилище. Здесь байты
+пишутся во временный каталог хранилища (та же файловая система, что и
+у blob'ов), SHA-256 считается на лету, и ``blobs.ingest`` остаётся только
+переименовать файл.
+"""
+import hashlib
+import os
+
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+
+from . import blobs
+
+
+class BlobUploadedFile(UploadedFile):
+    """Загруженный файл во временном каталоге хранилища с посчитанным SHA-256."""
+
+    def __init__(self, name, content_type, charset, content_type_extra=None):
+        self.path = blobs.temp_path()
+        super().__init__(
+            open(self.path, 'wb+'), name, content_type, 0, charset, content_type_extra
+        )
+        self.sha256 = None
+
+    def temporary_file_path(self):
+        return self.path
+
+
+class BlobUploadHandler(FileUploadHandler):
+    """Устанавливается в ``request.upload_handlers`` до обращения к ``request.FILES``.
+
+    После обработки запроса нужно вызвать ``cleanup()``: он удаляет файлы,
+    которые не были забраны в хранилище, в том числе недописанные при
+    обрыве соединения.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.files = []
+        self._digest = None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = BlobUploadedFile(
+            self.file_name, self.content_type, self.charset, self.content_type_extra
+        )
+        self.files.append(self.file)
+        self._digest = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self._digest.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.flush()
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self._digest.hexdigest()
+        return self.file
+
+    def upload_interrupted(self):
+        self.cleanup()
+
+    def cleanup(self):
+        for uploaded_file in self.files:
+            uploaded_file.close()
+            if os.path.exists(uploaded_file.path):
+                os.remove(uploaded_file.path)
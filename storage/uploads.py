@@ -0,0 +1,263 @@
+"""Возобновляемая загрузка файлов частями (chunked upload).
+
+Клиент создаёт сессию, отправляет пронумерованные части в любом порядке
+(в том числе параллельно), запрашивает список полученных частей и завершает
+загрузку. Части хранятся в ``MEDIA_ROOT/.uploads/<session_id>/`` до сборки,
+после чего содержимое попадает в хранилище blob'ов (см. ``storage.blobs``).
+"""
+import hashlib
+import logging
+import math
+import os
+import shutil
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import blobs, jobs, previews, usage
+from .models import UploadChunk, UploadSession, UserFile
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+SESSION_TTL = timedelta(hours=24)
+READ_BLOCK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _session_ttl():
+    return getattr(settings, 'UPLOAD_SESSION_TTL', SESSION_TTL)
+
+
+def sessions_root():
+    return os.path.join(settings.MEDIA_ROOT, '.uploads')
+
+
+def session_dir(session):
+    return os.path.join(sessions_root(), str(session.id))
+
+
+def chunk_path(session, index):
+    return os.path.join(session_dir(session), f'{index}.part')
+
+
+def expected_chunk_size(session, index):
+    if index < session.total_chunks - 1:
+        return session.chunk_size
+    return session.size - session.chunk_size * (session.total_chunks - 1)
+
+
+def save_uploaded_file(user, uploaded_file, comment=''):
+    """Сохраняет файл из multipart-запроса в хранилище и создаёт ``UserFile``.
+
+    Файл от ``BlobUploadHandler`` уже лежит в хранилище с посчитанным
+    SHA-256 и только переименовывается, остальные копируются с хешированием.
+    """
+    if getattr(uploaded_file, 'sha256', None):
+        uploaded_file.close()
+        tmp_path = uploaded_file.temporary_file_path()
+        sha256, size = uploaded_file.sha256, uploaded_file.size
+    else:
+        tmp_path, sha256, size = blobs.write_temp(uploaded_file.chunks())
+    try:
+        tmp_path, codec, stored_size = blobs.prepare(tmp_path, sha256, size, uploaded_file.name)
+        with blobs.atomic():
+            usage.add_file(user, size)
+            blob = blobs.ingest(tmp_path, sha256, size, codec, stored_size)
+            user_file = UserFile.objects.create(
+                user=user,
+                original_name=uploaded_file.name,
+                stored_name=f"{uuid.uuid4().hex}_{uploaded_file.name}",
+                comment=comment,
+                size=size,
+                blob=blob,
+            )
+            schedule_previews(user_file)
+            return user_file
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def schedule_previews(user_file):
+    """Ставит построение превью в очередь, если они строятся при загрузке."""
+    if not getattr(settings, 'PREVIEW_UPLOAD_SIZES', []) or not previews.enabled():
+        return
+    if previews.supported(user_file.original_name):
+        transaction.on_commit(lambda: jobs.enqueue('generate_previews', {'file_id': user_file.id}))
+
+
+def create_session(user, original_name, size, comment='', chunk_size=None):
+    max_chunk_size = getattr(settings, 'UPLOAD_MAX_CHUNK_SIZE', MAX_CHUNK_SIZE)
+    chunk_size = chunk_size or getattr(settings, 'UPLOAD_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    original_name = os.path.basename(original_name or '')
+    if not original_name:
+        raise UploadError('Имя файла не указано')
+    if size < 0:
+        raise UploadError('Некорректный размер файла')
+    if not 0 < chunk_size <= max_chunk_size:
+        raise UploadError(f'Размер части должен быть от 1 до {max_chunk_size} байт')
+    try:
+        usage.check_incoming(user, size)
+    except usage.QuotaExceeded:
+        raise UploadError('Превышена квота хранилища', status=413)
+    session = UploadSession.objects.create(
+        user=user,
+        original_name=original_name,
+        comment=comment,
+        size=size,
+        chunk_size=chunk_size,
+        total_chunks=max(1, math.ceil(size / chunk_size)),
+        expires_at=timezone.now() + _session_ttl(),
+    )
+    os.makedirs(session_dir(session), exist_ok=True)
+    return session
+
+
+def store_chunk(session, index, stream, checksum):
+    """Сохраняет часть ``index`` из потока, сверяя длину и SHA-256."""
+    if not 0 <= index < session.total_chunks:
+        raise UploadError('Некорректный номер части')
+    checksum = (checksum or '').strip().lower()
+    if checksum.startswith('sha256='):
+        checksum = checksum[len('sha256='):]
+    if len(checksum) != 64:
+        raise UploadError('Не передана контрольная сумма части (X-Chunk-Checksum)')
+
+    expected = expected_chunk_size(session, index)
+    os.makedirs(session_dir(session), exist_ok=True)
+    final_path = chunk_path(session, index)
+    tmp_path = f'{final_path}.{uuid.uuid4().hex}.tmp'
+    digest = hashlib.sha256()
+    written = 0
+    try:
+        with open(tmp_path, 'wb') as dest:
+            while True:
+                block = stream.read(READ_BLOCK_SIZE)
+                if not block:
+                    break
+                written += len(block)
+                if written > expected:
+                    raise UploadError('Размер части превышает ожидаемый')
+                digest.update(block)
+                dest.write(block)
+        if written != expected:
+            raise UploadError(f'Ожидалось {expected} байт, получено {written}')
+        if digest.hexdigest() != checksum:
+            raise UploadError('Контрольная сумма части не совпадает')
+        os.replace(tmp_path, final_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    try:
+        with transaction.atomic():
+            UploadChunk.objects.update_or_create(
+                session=session, index=index,
+                defaults={'size': written, 'checksum': checksum},
+            )
+    except IntegrityError:
+        # Параллельный повтор той же части успел создать запись первым.
+        UploadChunk.objects.filter(session=session, index=index).update(
+            size=written, checksum=checksum
+        )
+    # Продлевается только ещё не истёкшая сессия.
+    now = timezone.now()
+    UploadSession.objects.filter(pk=session.pk, expires_at__gte=now).update(
+        expires_at=now + _session_ttl()
+    )
+
+
+def received_chunks(session):
+    return list(
+        session.chunks.order_by('index').values_list('index', flat=True)
+    )
+
+
+def _read_parts(session):
+    for index in range(session.total_chunks):
+        with open(chunk_path(session, index), 'rb') as src:
+            for block in iter(lambda: src.read(READ_BLOCK_SIZE), b''):
+                yield block
+
+
+def complete_session(session):
+    """Собирает части в хранилище и создаёт ``UserFile``."""
+    received = set(received_chunks(session))
+    missing = [i for i in range(session.total_chunks) if i not in received]
+    if missing:
+        raise UploadError(f'Не получены части: {missing[:20]}', status=409)
+
+    parts_dir = session_dir(session)
+    tmp_path, sha256, size = blobs.write_temp(_read_parts(session))
+    try:
+        if size != session.size:
+            raise UploadError('Размер собранного файла не совпадает', status=409)
+        tmp_path, codec, stored_size = blobs.prepare(
+            tmp_path, sha256, size, session.original_name
+        )
+        with blobs.atomic():
+            try:
+                session = UploadSession.objects.select_for_update().get(pk=session.pk)
+            except UploadSession.DoesNotExist:
+                raise UploadError('Сессия загрузки уже завершена', status=409)
+            if session.expires_at < timezone.now():
+                raise UploadError('Сессия загрузки истекла', status=410)
+            try:
+                usage.add_file(session.user, size)
+            except usage.QuotaExceeded:
+                raise UploadError('Превышена квота хранилища', status=413)
+            blob = blobs.ingest(tmp_path, sha256, size, codec, stored_size)
+            user_file = UserFile.objects.create(
+                user=session.user,
+                original_name=session.original_name,
+                stored_name=f"{uuid.uuid4().hex}_{session.original_name}",
+                comment=session.comment,
+                size=size,
+                blob=blob,
+            )
+            schedule_previews(user_file)
+            session.delete()
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    shutil.rmtree(parts_dir, ignore_errors=True)
+    return user_file
+
+
+def abort_session(session):
+    parts_dir = session_dir(session)
+    session.delete()
+    shutil.rmtree(parts_dir, ignore_errors=True)
+
+
+def cleanup_expired_sessions(now=None):
+    """Удаляет просроченные сессии и их части. Возвращает число сессий."""
+    now = now or timezone.now()
+    removed = 0
+    for session in UploadSession.objects.filter(expires_at__lt=now).iterator():
+        abort_session(session)
+        removed += 1
+    # Каталоги частей без записи в БД (например, после сбоя при создании сессии).
+    root = sessions_root()
+    if os.path.isdir(root):
+        known = {
+            str(pk) for pk in UploadSession.objects.values_list('pk', flat=True)
+        }
+        for entry in os.scandir(root):
+            if entry.is_dir() and entry.name not in known:
+                age = now.timestamp() - entry.stat().st_mtime
+                if age > _session_ttl().total_seconds():
+                    shutil.rmtree(entry.path, ignore_errors=True)
+    if removed:
+        logger.info(f"Удалено просроченных сессий загрузки: {removed}")
+    return removed
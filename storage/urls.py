@@ -1,10 +1,16 @@
 from django.urls import path
 from django.http import JsonResponse
 
+from . import async_views
 from .views import (LoginView, LogoutView, RegisterView, delete_user,
                     toggle_admin_status, user_list, file_list, file_upload,
                     file_delete, file_rename, file_comment, file_download,
-                    file_special_download, index, profile_view)
+                    file_special_download, index, profile_view,
+                    upload_session_create, upload_session_detail,
+                    upload_session_chunk, upload_session_complete,
+                    file_batch, job_status, file_archive, cache_stats,
+                    file_search, metrics_view, scrub_status,
+                    file_preview)
 
 urlpatterns = [
     path('', index, name='index'),
@@ -15,12 +21,27 @@ urlpatterns = [
     path('users/', user_list, name='user_list'),
     path('users/<int:user_id>/', delete_user, name='delete_user'),
     path('users/<int:user_id>/toggle_admin/', toggle_admin_status, name='toggle_admin_status'),
+    path('jobs/<int:job_id>/', job_status, name='job_status'),
+    path('cache/stats/', cache_stats, name='cache_stats'),
+    path('metrics/', metrics_view, name='metrics'),
+    path('scrub/status/', scrub_status, name='scrub_status'),
     path('files/', file_list, name='file_list'),
-    path('files/upload/', file_upload),
-    path('files/<int:file_id>/delete/', file_delete),
-    path('files/<int:file_id>/rename/', file_rename),
-    path('files/<int:file_id>/comment/', file_comment),
-    path('files/<int:file_id>/download/', file_download),
-    path('files/special/<uuid:special_link>/', file_special_download),
+    path('files/search/', file_search, name='file_search'),
+    path('files/upload/', file_upload, name='file_upload'),
+    path('files/uploads/', upload_session_create, name='upload_session_create'),
+    path('files/uploads/<uuid:session_id>/', upload_session_detail, name='upload_session_detail'),
+    path('files/uploads/<uuid:session_id>/chunks/<int:index>/', upload_session_chunk, name='upload_session_chunk'),
+    path('files/uploads/<uuid:session_id>/complete/', upload_session_complete, name='upload_session_complete'),
+    path('files/batch/', file_batch, name='file_batch'),
+    path('files/archive/', file_archive, name='file_archive'),
+    path('files/<int:file_id>/delete/', file_delete, name='file_delete'),
+    path('files/<int:file_id>/rename/', file_rename, name='file_rename'),
+    path('files/<int:file_id>/comment/', file_comment, name='file_comment'),
+    path('files/<int:file_id>/download/', file_download, name='file_download'),
+    path('files/<int:file_id>/preview/', file_preview, name='file_preview'),
+    path('files/special/<uuid:special_link>/', file_special_download, name='file_special_download'),
     path('profile/', profile_view, name='profile'),
+    path('async/files/upload/', async_views.file_upload, name='async_file_upload'),
+    path('async/files/<int:file_id>/download/', async_views.file_download, name='async_file_download'),
+    path('async/files/special/<uuid:special_link>/', async_views.file_special_download, name='async_file_special_download'),
 ]
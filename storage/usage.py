@@ -0,0 +1,91 @@
+"""Денормализованные счётчики хранилища пользователя и квота.
+
+``User.file_count`` и ``User.total_bytes`` меняются только выражениями
+``F()`` в той же транзакции, что создаёт или удаляет ``UserFile``.
+Расхождение исправляет команда ``rebuild_storage_counters``.
+"""
+from django.conf import settings
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+
+from .models import User
+
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+def quota_for(user):
+    return _quota(user.quota_bytes)
+
+
+def _quota(quota_bytes):
+    if quota_bytes is not None:
+        return quota_bytes
+    return getattr(settings, 'DEFAULT_STORAGE_QUOTA', None)
+
+
+def check_incoming(user, size):
+    """Быстрая проверка до приёма тела запроса (по Content-Length или объявленному размеру).
+
+    ``user`` может прийти из кэша аутентификации, поэтому счётчик и квота
+    читаются из БД.
+    """
+    if size is None:
+        return
+    current = User.objects.values('total_bytes', 'quota_bytes').get(pk=user.pk)
+    quota = _quota(current['quota_bytes'])
+    if quota is not None and current['total_bytes'] + size > quota:
+        raise QuotaExceeded()
+
+
+def check_request_body(user, content_length):
+    """Проверка multipart-запроса по Content-Length до разбора тела.
+
+    Заголовки частей и поле комментария тоже входят в Content-Length,
+    поэтому на них оставляется запас; точная проверка — в ``add_file``.
+    """
+    try:
+        size = int(content_length or 0)
+    except ValueError:
+        return
+    check_incoming(user, max(size - MULTIPART_OVERHEAD, 0))
+
+
+def add_file(user, size):
+    """Учитывает новый файл; проверка квоты атомарна с обновлением счётчиков.
+
+    Вызывается внутри транзакции, создающей ``UserFile``.
+    """
+    # Квота берётся из строки, а не из ``user``: он может быть из кэша.
+    within_quota = Q(quota_bytes__isnull=False, total_bytes__lte=F('quota_bytes') - size)
+    default = getattr(settings, 'DEFAULT_STORAGE_QUOTA', None)
+    if default is None:
+        within_quota |= Q(quota_bytes__isnull=True)
+    else:
+        within_quota |= Q(quota_bytes__isnull=True, total_bytes__lte=default - size)
+    users = User.objects.filter(within_quota, pk=user.pk)
+    if not users.update(file_count=F('file_count') + 1, total_bytes=F('total_bytes') + size):
+        raise QuotaExceeded()
+
+
+def apply_deltas(deltas):
+    """Применяет ``{user_id: (Δфайлов, Δбайт)}``."""
+    for user_id, (files, size) in deltas.items():
+        if files or size:
+            # Не даём уйти в минус, если счётчики уже разошлись с данными.
+            User.objects.filter(pk=user_id).update(
+                file_count=Greatest(F('file_count') + files, 0),
+                total_bytes=Greatest(F('total_bytes') + size, 0),
+            )
+
+
+def removal_deltas(user_files):
+    """Отрицательные дельты для удаляемых ``UserFile``."""
+    deltas = {}
+    for user_file in user_files:
+        files, size = deltas.get(user_file.user_id, (0, 0))
+        deltas[user_file.user_id] = (files - 1, size - user_file.size)
+    return deltas
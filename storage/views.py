@@ -1,3 +1,5 @@
+import hmac
+import io
 import os
 import uuid
 import logging
@@ -5,8 +7,11 @@ import logging
 from django.conf import settings
 from django.contrib.auth import authenticate, get_user_model, login, logout
 from django.contrib.auth.hashers import make_password
-from django.http import FileResponse, HttpResponse, JsonResponse
+from django.db import transaction
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.http import content_disposition_header
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework import status
@@ -14,16 +19,43 @@ from rest_framework.decorators import api_view, permission_classes, parser_class
 from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.authtoken.models import Token
 from rest_framework.views import APIView
 from .serializers import LoginSerializer, RegisterSerializer, UserListSerializer, UserProfileSerializer
 from rest_framework.parsers import MultiPartParser, FormParser
 
-from .models import User, UserFile
+from . import (archives, authentication, batch, blobs, download_stats, downloads, jobs,
+               links, metrics, previews, replicas, scrub, search, uploads, usage)
+from .models import Job, UploadSession, User, UserFile
+from .pagination import (PaginationError, decode_cursor, keyset_page,
+                         parse_limit, parse_sort)
+from .upload_handlers import BlobUploadHandler
 
 User = get_user_model()
 
 logger = logging.getLogger(__name__)
 
+USER_LIST_SORT_FIELDS = {
+    'username': ('username', 'id'),
+    'file_size': ('total_bytes', 'id'),
+    'file_count': ('file_count', 'id'),
+}
+
+FILE_LIST_SORT_FIELDS = {
+    'upload_date': ('upload_date', 'id'),
+    'original_name': ('original_name', 'id'),
+    'size': ('size', 'id'),
+}
+
+FILE_LIST_FIELDS = (
+    'id', 'original_name', 'stored_name', 'comment', 'size',
+    'upload_date', 'last_download', 'download_count', 'special_link',
+)
+
+SEARCH_RESULT_FIELDS = ('id', 'original_name', 'comment', 'size', 'upload_date', 'special_link')
+
+PREVIEW_MAX_AGE = 365 * 24 * 60 * 60
+
 
 def index(request):
     return HttpResponse("<h1>Добро пожаловать в Logistics Storage App!</h1>")
@@ -31,25 +63,38 @@ def index(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replicas.read_replica
 def user_list(request):
     if not request.user.is_admin:
         return Response({"error": "Доступ запрещён"}, status=403)
 
+    sort_param = request.GET.get('sort') or 'username'
     users = User.objects.all()
-    users_data = []
-    for user in users:
-        file_count = user.files.count()
-        file_size = round(sum(f.size for f in user.files.all()) / (1024 * 1024), 2)
-        users_data.append({
+    try:
+        sort, descending = parse_sort(sort_param, USER_LIST_SORT_FIELDS, 'username')
+        page, next_cursor = keyset_page(
+            users,
+            USER_LIST_SORT_FIELDS[sort],
+            descending,
+            decode_cursor(request.GET.get('cursor'), sort_param),
+            parse_limit(request.GET.get('limit')),
+            sort_param,
+        )
+    except PaginationError as e:
+        return Response({"error": str(e)}, status=400)
+    users_data = [
+        {
             "id": user.id,
             "username": user.username,
             "full_name": user.full_name,
             "email": user.email,
             "is_admin": user.is_admin,
-            "file_count": file_count,
-            "file_size": file_size,
-        })
-    return Response(users_data)
+            "file_count": user.file_count,
+            "file_size": round(user.total_bytes / (1024 * 1024), 2),
+        }
+        for user in page
+    ]
+    return Response({"users": users_data, "next_cursor": next_cursor})
 
 
 @api_view(['DELETE'])
@@ -62,25 +107,76 @@ def delete_user(request, user_id):
         user = User.objects.get(id=user_id)
         if user == request.user:
             return Response({"error": "Нельзя удалить себя"}, status=400)
-        user_folder = os.path.join(settings.MEDIA_ROOT, user.storage_path)
-        for user_file in user.files.all():
-            file_path = os.path.join(user_folder, user_file.stored_name)
-            if os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                except Exception:
-                    pass
-        try:
-            if os.path.exists(user_folder) and not os.listdir(user_folder):
-                os.rmdir(user_folder)
-        except Exception:
-            pass
-        user.delete()
-        return Response({"message": "Пользователь удалён"})
+        # Файлы удаляет фоновая задача; до её завершения вход запрещён.
+        user.is_active = False
+        user.save(update_fields=['is_active'])
+        authentication.invalidate_user(user)
+        Token.objects.filter(user=user).delete()
+        job = jobs.enqueue('delete_user', {'user_id': user.id}, created_by=request.user)
+        return Response(
+            {"message": "Удаление пользователя запущено", "job_id": job.id},
+            status=202,
+        )
     except User.DoesNotExist:
         return Response({"error": "Пользователь не найден"}, status=404)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def job_status(request, job_id):
+    try:
+        job = Job.objects.get(id=job_id)
+    except Job.DoesNotExist:
+        return Response({"error": "Задача не найдена"}, status=404)
+    if not (request.user.is_admin or job.created_by_id == request.user.id):
+        return Response({"error": "Нет доступа"}, status=403)
+    return Response({
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "progress_done": job.progress_done,
+        "progress_total": job.progress_total,
+        "attempts": job.attempts,
+        "error": job.error,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def cache_stats(request):
+    if not request.user.is_admin:
+        return Response({"error": "Доступ запрещён"}, status=403)
+    return Response({
+        "auth_tokens": authentication.local_cache.stats(),
+        "special_links": links.cache.stats(),
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def scrub_status(request):
+    if not request.user.is_admin:
+        return Response({"error": "Доступ запрещён"}, status=403)
+    return Response(scrub.status())
+
+
+def metrics_view(request):
+    # Без DRF и токенов пользователей: Prometheus передаёт METRICS_TOKEN в
+    # "Authorization: Bearer". Адрес клиента не проверяется — за nginx это
+    # всегда адрес прокси.
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if not token:
+        return HttpResponse(status=403)
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(credentials.strip().encode(), token.encode()):
+        response = HttpResponse(status=401)
+        response['WWW-Authenticate'] = 'Bearer realm="metrics"'
+        return response
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def toggle_admin_status(request, user_id):
@@ -91,6 +187,7 @@ def toggle_admin_status(request, user_id):
         user = User.objects.get(id=user_id)
         user.is_admin = not user.is_admin
         user.save()
+        authentication.invalidate_user(user)
         return Response({
             "message": "Права администратора изменены",
             "is_admin": user.is_admin
@@ -99,8 +196,44 @@ def toggle_admin_status(request, user_id):
         return Response({"error": "Пользователь не найден"}, status=404)
 
 
+def _parse_file_fields(raw_fields):
+    if not raw_fields:
+        return FILE_LIST_FIELDS
+    fields = [field.strip() for field in raw_fields.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in FILE_LIST_FIELDS]
+    if unknown:
+        raise PaginationError(f"Неизвестные поля: {', '.join(unknown)}")
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+    return tuple(fields)
+
+
+def _filter_files(files, params):
+    name = params.get('name')
+    if name:
+        files = files.filter(original_name__startswith=name)
+    try:
+        if params.get('min_size'):
+            files = files.filter(size__gte=int(params['min_size']))
+        if params.get('max_size'):
+            files = files.filter(size__lte=int(params['max_size']))
+    except ValueError:
+        raise PaginationError('Некорректный размер файла')
+    for param, lookup in (('uploaded_after', 'upload_date__gte'),
+                          ('uploaded_before', 'upload_date__lt')):
+        if params.get(param):
+            value = parse_datetime(params[param])
+            if value is None:
+                raise PaginationError(f'Некорректная дата: {param}')
+            if timezone.is_naive(value):
+                value = timezone.make_aware(value)
+            files = files.filter(**{lookup: value})
+    return files
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replicas.read_replica
 def file_list(request):
     if not request.user or not request.user.is_authenticated:
         return Response({"error": "Нет авторизации"}, status=401)
@@ -113,21 +246,24 @@ def file_list(request):
             return Response({"error": "Пользователь не найден"}, status=404)
     else:
         user = request.user
-    files = UserFile.objects.filter(user=user)
-    files_data = [
-        {
-            "id": f.id,
-            "original_name": f.original_name,
-            "stored_name": f.stored_name,
-            "comment": f.comment,
-            "size": f.size,
-            "upload_date": f.upload_date,
-            "last_download": f.last_download,
-            "special_link": f.special_link,
-        }
-        for f in files
-    ]
-    data = {"files": files_data}
+    try:
+        files = _filter_files(UserFile.objects.filter(user=user), request.GET)
+        fields = _parse_file_fields(request.GET.get('fields'))
+        sort_param = request.GET.get('sort') or 'upload_date'
+        sort, descending = parse_sort(sort_param, FILE_LIST_SORT_FIELDS, 'upload_date')
+        sort_fields = FILE_LIST_SORT_FIELDS[sort]
+        page, next_cursor = keyset_page(
+            files.only(*set(fields) | set(sort_fields)),
+            sort_fields,
+            descending,
+            decode_cursor(request.GET.get('cursor'), sort_param),
+            parse_limit(request.GET.get('limit')),
+            sort_param,
+        )
+    except PaginationError as e:
+        return Response({"error": str(e)}, status=400)
+    files_data = [{field: getattr(f, field) for field in fields} for f in page]
+    data = {"files": files_data, "next_cursor": next_cursor}
     if user_id and request.user.is_admin:
         data["owner"] = {
             "id": user.id,
@@ -138,11 +274,66 @@ def file_list(request):
     return Response(data)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@replicas.read_replica
+def file_search(request):
+    query = (request.GET.get('q') or '').strip()
+    if not search.MIN_QUERY_LENGTH <= len(query) <= search.MAX_QUERY_LENGTH:
+        return Response(
+            {"error": f"Длина запроса — от {search.MIN_QUERY_LENGTH} до {search.MAX_QUERY_LENGTH} символов"},
+            status=400,
+        )
+    user_id = request.GET.get('user_id')
+    if request.user.is_admin:
+        # Администратор ищет по всем пользователям или по одному.
+        files = UserFile.objects.select_related('user').only(*SEARCH_RESULT_FIELDS, 'user__username')
+        if user_id:
+            if not user_id.isdigit():
+                return Response({"error": "Некорректный user_id"}, status=400)
+            files = files.filter(user_id=user_id)
+    else:
+        files = UserFile.objects.filter(user=request.user).only(*SEARCH_RESULT_FIELDS)
+    try:
+        page, next_cursor = keyset_page(
+            search.search_files(files, query),
+            ('rank', 'id'),
+            True,
+            decode_cursor(request.GET.get('cursor'), 'rank'),
+            parse_limit(request.GET.get('limit')),
+            'rank',
+        )
+    except PaginationError as e:
+        return Response({"error": str(e)}, status=400)
+    results = []
+    for user_file in page:
+        item = {field: getattr(user_file, field) for field in SEARCH_RESULT_FIELDS}
+        item["rank"] = user_file.rank
+        if request.user.is_admin:
+            item["owner"] = {"id": user_file.user_id, "username": user_file.user.username}
+        results.append(item)
+    return Response({"files": results, "next_cursor": next_cursor})
+
+
 @csrf_exempt
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 @parser_classes([MultiPartParser, FormParser])
 def file_upload(request):
+    # Квота проверяется по Content-Length до того, как тело будет разобрано и записано.
+    try:
+        usage.check_request_body(request.user, request.META.get('CONTENT_LENGTH'))
+    except usage.QuotaExceeded:
+        return Response({"error": "Превышена квота хранилища"}, status=413)
+    handler = BlobUploadHandler(request._request)
+    request._request.upload_handlers = [handler]
+    try:
+        return _save_upload(request)
+    finally:
+        handler.cleanup()
+
+
+def _save_upload(request):
     file = request.FILES.get('file')
     comment = request.data.get('comment', '')
     if not file:
@@ -153,29 +344,119 @@ def file_upload(request):
         logger.error(f"У пользователя {request.user.username} отсутствует storage_path.")
         return Response({"error": "Ошибка конфигурации пользователя"}, status=500)
 
-    stored_name = f"{uuid.uuid4().hex}_{file.name}"
-    user_folder = os.path.join(settings.MEDIA_ROOT, request.user.storage_path)
-    os.makedirs(user_folder, exist_ok=True)
-    file_path = os.path.join(user_folder, stored_name)
     try:
-        with open(file_path, 'wb+') as dest:
-            for chunk in file.chunks():
-                dest.write(chunk)
-        user_file = UserFile.objects.create(
-            user=request.user,
-            original_name=file.name,
-            stored_name=stored_name,
-            comment=comment,
-            size=file.size,
-        )
-        return Response({"message": "Файл загружен", "id": user_file.id})
+        user_file = uploads.save_uploaded_file(request.user, file, comment)
+        return Response({"message": "Файл загружен", "id": user_file.id, "sha256": user_file.blob_id})
+    except usage.QuotaExceeded:
+        return Response({"error": "Превышена квота хранилища"}, status=413)
     except Exception as e:
         logger.error(f"Ошибка сохранения файла: {str(e)}")
-        if os.path.exists(file_path):
-            os.remove(file_path)
         return Response({"error": "Ошибка сохранения файла"}, status=500)
 
 
+def _get_upload_session(request, session_id, allow_expired=False):
+    try:
+        session = UploadSession.objects.get(id=session_id)
+    except UploadSession.DoesNotExist:
+        return None, Response({"error": "Сессия загрузки не найдена"}, status=404)
+    if session.user_id != request.user.id:
+        return None, Response({"error": "Нет доступа"}, status=403)
+    # Просроченную сессию можно только отменить; её части удалит cleanup_upload_sessions.
+    if not allow_expired and session.expires_at < timezone.now():
+        return None, Response({"error": "Сессия загрузки истекла"}, status=410)
+    return session, None
+
+
+def _upload_session_data(session, received):
+    received_set = set(received)
+    return {
+        "id": session.id,
+        "file_name": session.original_name,
+        "size": session.size,
+        "chunk_size": session.chunk_size,
+        "total_chunks": session.total_chunks,
+        "received_chunks": received,
+        "missing_chunks": [
+            i for i in range(session.total_chunks) if i not in received_set
+        ],
+        "expires_at": session.expires_at,
+    }
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def upload_session_create(request):
+    if not getattr(request.user, 'storage_path', None):
+        logger.error(f"У пользователя {request.user.username} отсутствует storage_path.")
+        return Response({"error": "Ошибка конфигурации пользователя"}, status=500)
+    try:
+        size = int(request.data.get('size'))
+        chunk_size = request.data.get('chunk_size')
+        chunk_size = int(chunk_size) if chunk_size else None
+    except (TypeError, ValueError):
+        return Response({"error": "Некорректный размер файла"}, status=400)
+    try:
+        session = uploads.create_session(
+            request.user,
+            request.data.get('file_name'),
+            size,
+            comment=request.data.get('comment', ''),
+            chunk_size=chunk_size,
+        )
+    except uploads.UploadError as e:
+        return Response({"error": str(e)}, status=e.status)
+    return Response(_upload_session_data(session, []), status=201)
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def upload_session_detail(request, session_id):
+    session, error = _get_upload_session(request, session_id, allow_expired=request.method == 'DELETE')
+    if error:
+        return error
+    if request.method == 'DELETE':
+        uploads.abort_session(session)
+        return Response({"message": "Загрузка отменена"})
+    return Response(_upload_session_data(session, uploads.received_chunks(session)))
+
+
+@api_view(['PUT'])
+@permission_classes([IsAuthenticated])
+def upload_session_chunk(request, session_id, index):
+    session, error = _get_upload_session(request, session_id)
+    if error:
+        return error
+    try:
+        uploads.store_chunk(
+            session,
+            index,
+            request.stream or io.BytesIO(),
+            request.headers.get('X-Chunk-Checksum'),
+        )
+    except uploads.UploadError as e:
+        return Response({"error": str(e)}, status=e.status)
+    except OSError as e:
+        logger.error(f"Ошибка сохранения части {index} сессии {session.id}: {str(e)}")
+        return Response({"error": "Ошибка сохранения части файла"}, status=500)
+    return Response({"message": "Часть получена", "index": index})
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def upload_session_complete(request, session_id):
+    session, error = _get_upload_session(request, session_id)
+    if error:
+        return error
+    try:
+        user_file = uploads.complete_session(session)
+    except uploads.UploadError as e:
+        return Response({"error": str(e)}, status=e.status)
+    except Exception as e:
+        logger.error(f"Ошибка сборки файла сессии {session.id}: {str(e)}")
+        return Response({"error": "Ошибка сохранения файла"}, status=500)
+    return Response({"message": "Файл загружен", "id": user_file.id})
+
+
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 def file_delete(request, file_id):
@@ -185,14 +466,33 @@ def file_delete(request, file_id):
         return Response({"error": "Файл не найден"}, status=404)
     if not (request.user.is_admin or user_file.user == request.user):
         return Response({"error": "Нет доступа"}, status=403)
-    user_folder = os.path.join(settings.MEDIA_ROOT, user_file.user.storage_path)
-    file_path = os.path.join(user_folder, user_file.stored_name)
-    if os.path.exists(file_path):
-        os.remove(file_path)
-    user_file.delete()
+    if not user_file.blob_id:
+        file_path = blobs.legacy_file_path(user_file)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    with transaction.atomic():
+        # Повторное удаление того же файла не должно второй раз уменьшить счётчики.
+        deleted, _ = UserFile.objects.filter(pk=user_file.pk).delete()
+        if deleted:
+            if user_file.blob_id:
+                blobs.release({user_file.blob_id: 1})
+            usage.apply_deltas(usage.removal_deltas([user_file]))
+    links.invalidate(user_file.special_link)
     return Response({"message": "Файл удалён"})
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def file_batch(request):
+    if not isinstance(request.data, dict):
+        return Response({"error": "Тело запроса должно быть объектом с полем operations"}, status=400)
+    try:
+        results = batch.apply_operations(request.user, request.data.get('operations'))
+    except batch.BatchError as e:
+        return Response({"error": str(e)}, status=400)
+    return Response({"results": results})
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def file_rename(request, file_id):
@@ -207,6 +507,7 @@ def file_rename(request, file_id):
         return Response({"error": "Нет доступа"}, status=403)
     user_file.original_name = new_name
     user_file.save()
+    links.invalidate(user_file.special_link)
     return Response({"message": "Имя файла изменено"})
 
 
@@ -229,33 +530,123 @@ def file_comment(request, file_id):
 @permission_classes([IsAuthenticated])
 def file_download(request, file_id):
     try:
-        user_file = UserFile.objects.get(id=file_id)
+        user_file = UserFile.objects.select_related('blob').get(id=file_id)
     except UserFile.DoesNotExist:
         return Response({"error": "Файл не найден"}, status=404)
     if not (request.user.is_admin or user_file.user == request.user):
         return Response({"error": "Нет доступа"}, status=403)
-    user_folder = os.path.join(settings.MEDIA_ROOT, user_file.user.storage_path)
-    file_path = os.path.join(user_folder, user_file.stored_name)
+    file_path = blobs.user_file_path(user_file)
     if not os.path.exists(file_path):
         return Response({"error": "Файл не найден на сервере"}, status=404)
-    user_file.last_download = timezone.now()
-    user_file.save()
-    return FileResponse(open(file_path, 'rb'), as_attachment=True, filename=user_file.original_name)
+    response = downloads.file_response(
+        request, file_path, user_file.original_name, content_hash=user_file.blob_id,
+        codec=user_file.blob.codec if user_file.blob_id else '', size=user_file.size,
+    )
+    if downloads.counts_as_download(request, response):
+        download_stats.record(user_file.id)
+    return response
 
 
 @api_view(['GET'])
-def file_special_download(request, special_link):
+@permission_classes([IsAuthenticated])
+def file_preview(request, file_id):
     try:
-        user_file = UserFile.objects.get(special_link=special_link)
+        user_file = UserFile.objects.select_related('blob').get(id=file_id)
     except UserFile.DoesNotExist:
         return Response({"error": "Файл не найден"}, status=404)
-    user_folder = os.path.join(settings.MEDIA_ROOT, user_file.user.storage_path)
-    file_path = os.path.join(user_folder, user_file.stored_name)
+    if not (request.user.is_admin or user_file.user_id == request.user.id):
+        return Response({"error": "Нет доступа"}, status=403)
+    if not (previews.enabled() and user_file.blob_id and previews.supported(user_file.original_name)):
+        return Response({"error": "Превью для этого файла недоступно"}, status=404)
+    try:
+        bucket = previews.bucket_for(int(request.GET.get('size', previews.DEFAULT_BUCKET)))
+    except ValueError:
+        return Response({"error": "Некорректный размер превью"}, status=400)
+
+    # Содержимое файла не меняется, поэтому превью можно кэшировать навсегда.
+    headers = {
+        'ETag': f'"{user_file.blob_id}-{bucket}"',
+        'Cache-Control': f'private, max-age={PREVIEW_MAX_AGE}, immutable',
+    }
+    if downloads.etag_matches(request, headers['ETag']):
+        return HttpResponse(status=304, headers=headers)
+    file_path = blobs.user_file_path(user_file)
     if not os.path.exists(file_path):
         return Response({"error": "Файл не найден на сервере"}, status=404)
-    user_file.last_download = timezone.now()
-    user_file.save()
-    return FileResponse(open(file_path, 'rb'), as_attachment=True, filename=user_file.original_name)
+    try:
+        preview_path = previews.get_or_create(user_file.blob_id, file_path, user_file.blob.codec, bucket)
+    except previews.PreviewBusy:
+        return Response({"error": "Превью строится, повторите запрос позже"}, status=503,
+                        headers={'Retry-After': '5'})
+    except previews.PreviewUnavailable:
+        return Response({"error": "Не удалось построить превью"}, status=415)
+    return FileResponse(open(preview_path, 'rb'), content_type=previews.CONTENT_TYPE, headers=headers)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def file_archive(request):
+    user_id = request.GET.get('user_id')
+    raw_ids = request.GET.get('ids')
+    if user_id:
+        if not request.user.is_admin and str(request.user.id) != user_id:
+            return Response({"error": "Доступ запрещён"}, status=403)
+        try:
+            owner = User.objects.get(id=user_id)
+        except (User.DoesNotExist, ValueError):
+            return Response({"error": "Пользователь не найден"}, status=404)
+        files = archives.iter_files(owner.files.select_related('user', 'blob'))
+        archive_name = f"{owner.username}.zip"
+    elif raw_ids is not None:
+        try:
+            ids = {int(file_id) for file_id in raw_ids.split(',') if file_id.strip()}
+        except ValueError:
+            return Response({"error": "Некорректный список файлов"}, status=400)
+        if not ids:
+            return Response({"error": "Не указаны файлы"}, status=400)
+        files = list(
+            UserFile.objects.select_related('user', 'blob').filter(id__in=ids).order_by('id')
+        )
+        if len(files) != len(ids):
+            return Response({"error": "Файл не найден"}, status=404)
+        if not all(request.user.is_admin or f.user_id == request.user.id for f in files):
+            return Response({"error": "Нет доступа"}, status=403)
+        for user_file in files:
+            if not os.path.exists(blobs.user_file_path(user_file)):
+                return Response(
+                    {"error": f"Файл не найден на сервере: {user_file.original_name}"},
+                    status=404,
+                )
+        archive_name = "files.zip"
+    else:
+        return Response({"error": "Не указаны файлы"}, status=400)
+
+    response = StreamingHttpResponse(
+        archives.stream_zip(files, on_complete=download_stats.record_many),
+        content_type='application/zip',
+    )
+    response['Content-Disposition'] = content_disposition_header(True, archive_name)
+    return response
+
+
+@api_view(['GET'])
+def file_special_download(request, special_link):
+    link = links.resolve(special_link)
+    if link is None:
+        return Response({"error": "Файл не найден"}, status=404)
+    if not os.path.exists(link.path):
+        # Запись в кэше могла устареть (файл сжат или удалён в другом процессе).
+        links.invalidate(special_link)
+        link = links.resolve(special_link)
+        if link is None or not os.path.exists(link.path):
+            return Response({"error": "Файл не найден на сервере"}, status=404)
+    response = downloads.file_response(
+        request, link.path, link.original_name, content_hash=link.validator,
+        codec=link.codec, size=link.size,
+    )
+    if downloads.counts_as_download(request, response):
+        download_stats.record(link.file_id)
+    return response
 
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -263,8 +654,6 @@ class RegisterView(APIView):
     permission_classes = [AllowAny]
 
     def post(self, request):
-        logger.info(f"Registration data received: {request.data}")
-        
         required_fields = ['username', 'email', 'full_name', 'password']
         for field in required_fields:
             if field not in request.data or not str(request.data[field]).strip():
@@ -314,7 +703,6 @@ class LoginView(APIView):
     permission_classes = [AllowAny]
 
     def post(self, request):
-        logger.info(f"Login attempt with data: {request.data}")
         serializer = LoginSerializer(data=request.data)
         if not serializer.is_valid():
             logger.warning(f"Login validation failed: {serializer.errors}")
@@ -323,15 +711,14 @@ class LoginView(APIView):
         username = serializer.validated_data.get('username')
         password = serializer.validated_data.get('password')
         
-        logger.info(f"Authenticating user: {username}")
         user = authenticate(username=username, password=password)
         
         if user and user.is_active:
-            logger.info(f"User {username} authenticated successfully.")
+            logger.info("User %s authenticated successfully.", username)
             try:
                 from rest_framework.authtoken.models import Token
                 token, _ = Token.objects.get_or_create(user=user)
-                logger.info(f"Token created/retrieved for user {username}.")
+                logger.debug("Token created/retrieved for user %s.", username)
                 return Response({
                     'success': True,
                     'is_admin': getattr(user, 'is_admin', False),
@@ -355,6 +742,7 @@ class LogoutView(APIView):
             from rest_framework.authtoken.models import Token
             token = getattr(request.user, 'auth_token', None)
             if token:
+                authentication.invalidate_tokens([token.key])
                 token.delete()
         except Exception as e:
             logger.warning(f"Token deletion failed for {request.user.username}: {e}")
@@ -373,12 +761,18 @@ def health_check(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replicas.read_replica
 def profile_view(request):
     user = request.user
+    # Пользователь мог прийти из кэша аутентификации, счётчики читаем из БД.
+    user.refresh_from_db(fields=['file_count', 'total_bytes', 'quota_bytes'])
     return Response({
         'id': user.id,
         'username': user.username,
         'full_name': getattr(user, 'full_name', ''),
         'email': user.email,
         'is_admin': getattr(user, 'is_admin', False),
+        'file_count': user.file_count,
+        'total_bytes': user.total_bytes,
+        'quota_bytes': usage.quota_for(user),
     })